@@ -0,0 +1,260 @@
+import argparse
+import sqlite3
+import time
+
+# Sales are bucketed by the local day and hour of each sale, using the UTC offset in force
+# at that moment, so summer and winter sales land in the hour shown on the clock. Days are
+# numbered from 1970-01-01 local time. These are the SQL equivalents of local_day_hour.
+DAY = 24 * 60 * 60
+LOCAL_DAY = "CAST(strftime('%s', created_at, 'unixepoch', 'localtime') AS INTEGER) / 86400"
+LOCAL_HOUR = "CAST(strftime('%H', created_at, 'unixepoch', 'localtime') AS INTEGER)"
+# Sales migrated from before order times were kept have created_at = 0. They count towards
+# product totals but not towards any day, and go in hour UNKNOWN_HOUR instead of a real hour.
+UNKNOWN_HOUR = 24
+
+
+def local_day_hour(created_at):
+    """Local day number and hour of day of a time in seconds since the epoch."""
+    local = time.localtime(created_at)
+    return (int(created_at) + local.tm_gmtoff) // DAY, local.tm_hour
+
+
+def connect(filename):
+    """Open the database read-only, so a report never holds up checkouts (WAL lets both run)."""
+    return sqlite3.connect(f"file:{filename}?mode=ro", uri=True, check_same_thread=False)
+
+
+def empty_report():
+    return {
+        "orders": 0,
+        "units": 0,
+        "revenue": 0.0,
+        "products": {},  # product ID -> {"ID", "Name", "Units", "Revenue"}
+        "hours": [{"Units": 0, "Revenue": 0.0} for _ in range(24)],
+    }
+
+
+def finish_report(report):
+    """Round the money and sort products by revenue, best first."""
+    report["revenue"] = round(report["revenue"], 2)
+    report["products"] = sorted(report["products"].values(), key=lambda product: product["Revenue"], reverse=True)
+    for row in report["products"] + report["hours"]:
+        row["Revenue"] = round(row["Revenue"], 2)
+    return report
+
+
+def add_sales(report, product_id, name, hour, units, revenue):
+    """Fold one (product, hour) total into the report."""
+    product = report["products"].get(product_id)
+    if product is None:
+        product = report["products"][product_id] = {"ID": product_id, "Name": name, "Units": 0, "Revenue": 0.0}
+    product["Units"] += units
+    product["Revenue"] += revenue
+    if hour is not None:  # None for lines migrated from before order times were kept
+        report["hours"][hour]["Units"] += units
+        report["hours"][hour]["Revenue"] += revenue
+    report["units"] += units
+    report["revenue"] += revenue
+
+
+def create_rollups(conn):
+    """Create the rollup tables. Returns True if they are new and need rebuild_rollups."""
+    new = not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_sales'").fetchone()
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS product_sales (
+        product_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        units INTEGER NOT NULL,
+        revenue REAL NOT NULL,
+        last_sold REAL NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS daily_sales (
+        day INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        units INTEGER NOT NULL,
+        revenue REAL NOT NULL,
+        PRIMARY KEY (day, product_id)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS hourly_sales (
+        hour INTEGER PRIMARY KEY,
+        orders INTEGER NOT NULL,
+        units INTEGER NOT NULL,
+        revenue REAL NOT NULL
+    )
+    ''')
+    return new
+
+
+def update_rollups(conn, orders):
+    """Add (created_at, lines) orders to the rollups. Run it in the same transaction that records them."""
+    products, days, hours = {}, {}, {}
+    for created_at, lines in orders:
+        day, hour = local_day_hour(created_at)
+        hour_row = hours.setdefault(hour, [0, 0, 0.0])
+        hour_row[0] += 1
+        for line in lines:
+            revenue = line["Price"] * line["Quantity"]
+            product = products.setdefault(line["ID"], [line["Name"], 0, 0.0, created_at])
+            product[1] += line["Quantity"]
+            product[2] += revenue
+            product[3] = max(product[3], created_at)
+            day_row = days.setdefault((day, line["ID"]), [0, 0.0])
+            day_row[0] += line["Quantity"]
+            day_row[1] += revenue
+            hour_row[1] += line["Quantity"]
+            hour_row[2] += revenue
+
+    # Folded in Python first, so a batch of orders is one upsert per product, day and hour
+    conn.executemany('''
+    INSERT INTO product_sales (product_id, name, units, revenue, last_sold) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (product_id) DO UPDATE SET name = excluded.name, units = units + excluded.units,
+        revenue = revenue + excluded.revenue, last_sold = MAX(last_sold, excluded.last_sold)
+    ''', [(product_id, *row) for product_id, row in products.items()])
+    conn.executemany('''
+    INSERT INTO daily_sales (day, product_id, units, revenue) VALUES (?, ?, ?, ?)
+    ON CONFLICT (day, product_id) DO UPDATE SET units = units + excluded.units, revenue = revenue + excluded.revenue
+    ''', [(*key, *row) for key, row in days.items()])
+    conn.executemany('''
+    INSERT INTO hourly_sales (hour, orders, units, revenue) VALUES (?, ?, ?, ?)
+    ON CONFLICT (hour) DO UPDATE SET orders = orders + excluded.orders, units = units + excluded.units,
+        revenue = revenue + excluded.revenue
+    ''', [(hour, *row) for hour, row in hours.items()])
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup from the orders and transactions tables in bulk."""
+    with conn:
+        conn.execute("DELETE FROM product_sales")
+        conn.execute("DELETE FROM daily_sales")
+        conn.execute("DELETE FROM hourly_sales")
+        conn.execute('''
+        INSERT INTO product_sales (product_id, name, units, revenue, last_sold)
+        SELECT product_id, MAX(name), SUM(quantity), SUM(price * quantity), MAX(created_at)
+        FROM transactions NOT INDEXED GROUP BY product_id
+        ''')
+        # Packed into one integer key for the same reason as in sales_report
+        conn.execute(f'''
+        INSERT INTO daily_sales (day, product_id, units, revenue)
+        SELECT day_product / 1000000000, day_product % 1000000000, units, revenue FROM (
+            SELECT {LOCAL_DAY} * 1000000000 + product_id AS day_product,
+                   SUM(quantity) AS units, SUM(price * quantity) AS revenue
+            FROM transactions NOT INDEXED WHERE created_at != 0 GROUP BY day_product
+        )
+        ''')
+        conn.execute(f'''
+        INSERT INTO hourly_sales (hour, orders, units, revenue)
+        SELECT CASE WHEN created_at = 0 THEN ? ELSE {LOCAL_HOUR} END AS hour, COUNT(*), 0, 0
+        FROM orders GROUP BY hour
+        ''', (UNKNOWN_HOUR,))
+        conn.execute(f'''
+        INSERT INTO hourly_sales (hour, orders, units, revenue)
+        SELECT CASE WHEN created_at = 0 THEN ? ELSE {LOCAL_HOUR} END AS hour, 0, SUM(quantity), SUM(price * quantity)
+        FROM transactions NOT INDEXED WHERE true GROUP BY hour
+        ON CONFLICT (hour) DO UPDATE SET units = excluded.units, revenue = excluded.revenue
+        ''', (UNKNOWN_HOUR,))
+
+
+def rollup_report(conn):
+    """The all-time report read from the rollups: products + 24 rows, however long the history."""
+    report = empty_report()
+    for product_id, name, units, revenue in conn.execute("SELECT product_id, name, units, revenue FROM product_sales"):
+        report["products"][product_id] = {"ID": product_id, "Name": name, "Units": units, "Revenue": revenue}
+        report["units"] += units
+        report["revenue"] += revenue
+    for hour, orders, units, revenue in conn.execute("SELECT hour, orders, units, revenue FROM hourly_sales"):
+        report["orders"] += orders
+        if hour != UNKNOWN_HOUR:
+            report["hours"][hour] = {"Units": units, "Revenue": revenue}
+    return finish_report(report)
+
+
+def daily_sales(conn, start=None, end=None):
+    """Units and revenue per local day between start and end, read from the rollups."""
+    first = -1 if start is None else local_day_hour(start)[0]
+    last = 1 << 62 if end is None else local_day_hour(end)[0]
+    return [
+        {"Day": time.strftime("%Y-%m-%d", time.gmtime(day * DAY)), "Units": units, "Revenue": round(revenue, 2)}
+        for day, units, revenue in conn.execute('''
+        SELECT day, SUM(units), SUM(revenue) FROM daily_sales WHERE day BETWEEN ? AND ? GROUP BY day ORDER BY day
+        ''', (first, last))
+    ]
+
+
+def sales_report(conn, start=None, end=None):
+    """Revenue, units per product and sales by hour of day from the transactions table.
+
+    With no start or end the rollups answer it without touching the line items.
+    Otherwise start and end are seconds since the epoch. SQLite does the
+    scan and grouping in one pass over the line items, so Python only folds at
+    most products x 25 rows. Product and hour are packed into one integer key
+    (UNKNOWN_HOUR for migrated lines) because SQLite groups by sorting, and
+    sorting one integer is much cheaper than a pair. A date range uses the
+    created_at index.
+    """
+    if start is None and end is None:
+        return rollup_report(conn)
+
+    where, params = [], []
+    if start is not None:
+        where.append("created_at >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("created_at <= ?")
+        params.append(end)
+    condition = f"WHERE {' AND '.join(where)}" if where else ""
+
+    report = empty_report()
+    rows = conn.execute(f'''
+    SELECT product_id * 25 + CASE WHEN created_at = 0 THEN ? ELSE {LOCAL_HOUR} END AS product_hour,
+           MAX(name), SUM(quantity), SUM(price * quantity)
+    FROM transactions {condition}
+    GROUP BY product_hour
+    ''', [UNKNOWN_HOUR] + params)
+    for product_hour, name, units, revenue in rows:
+        product_id, hour = divmod(product_hour, 25)
+        add_sales(report, product_id, name, hour if hour != UNKNOWN_HOUR else None, units, revenue)
+
+    report["orders"] = conn.execute(f"SELECT COUNT(*) FROM orders {condition}", params).fetchone()[0]
+    return finish_report(report)
+
+
+def sales_report_from_records(records):
+    """The same report from transaction log records (see RECORDS.py), for when there is no database."""
+    report = empty_report()
+    for record in records:
+        report["orders"] += 1
+        hour = time.localtime(record["created_at"]).tm_hour
+        for line in record["lines"]:
+            add_sales(report, line["ID"], line["Name"], hour, line["Quantity"], line["Price"] * line["Quantity"])
+    return finish_report(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a sales report, or rebuild the sales rollups.")
+    parser.add_argument("--database", default="vending_machine.db", help="database to read")
+    parser.add_argument("--rebuild", action="store_true", help="recompute the rollups from every recorded sale")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        conn = sqlite3.connect(args.database)
+        start = time.perf_counter()
+        create_rollups(conn)
+        rebuild_rollups(conn)
+        print(f"Rebuilt rollups in {time.perf_counter() - start:.2f}s")
+        conn.close()
+        return
+
+    conn = connect(args.database)
+    report = sales_report(conn)
+    conn.close()
+    print(f"Orders: {report['orders']} | Units sold: {report['units']} | Revenue: £{report['revenue']:.2f}")
+    for product in report["products"][:10]:
+        print(f"  {product['Name']}: {product['Units']} sold, £{product['Revenue']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
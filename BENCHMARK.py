@@ -0,0 +1,663 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import socket
+import tempfile
+import threading
+import time
+
+import ANALYTICS as analytics
+import CATALOG as catalog
+import MAINCLIENT as client
+import MAINSERVER as server
+from PROTOCOL import PUSH_ID, FrameDecoder, encode_frame, recv_messages
+from RECORDS import RecordReader, encode_record, mask_card
+
+
+def make_catalog(size):
+    """Build a synthetic catalog of `size` items."""
+    return [
+        {"ID": i, "Name": f"Product {i}", "Price": round(1 + (i % 5000) / 100, 2), "Quantity": i % 50}
+        for i in range(1, size + 1)
+    ]
+
+
+def write_catalog(filename, items):
+    with open(filename, "w") as file:
+        file.write("".join(server.format_inventory_line(item) for item in items))
+
+
+def timed(function, repeat=3):
+    """Return the best wall time of `repeat` runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def split_parse(filename):
+    """The hand-written split loop the inventory readers used before the shared parser."""
+    items = {}
+    with open(filename, "r") as file:
+        for line in file:
+            parts = line.strip().split(", ")
+            item = {}
+            for part in parts:
+                key, value = part.split(": ")
+                if key in ["ID", "Quantity"]:
+                    value = int(value)
+                elif key == "Price":
+                    value = float(value)
+                item[key] = value
+            items[item["ID"]] = item
+    return items
+
+
+def bench_parser(sizes, workdir):
+    """Compare the split loop, the compiled parser and a parse-cache hit."""
+    results = []
+    for size in sizes:
+        filename = os.path.join(workdir, f"catalog_{size}.txt")
+        write_catalog(filename, make_catalog(size))
+        server._parse_cache.clear()
+        results.append({
+            "benchmark": "parser",
+            "lines": size,
+            "split_loop_s": timed(lambda: split_parse(filename)),
+            "compiled_regex_s": timed(lambda: server.parse_inventory_text(open(filename).read())),
+            "cache_hit_s": timed(lambda: server.load_inventory_file(filename)),
+        })
+    return results
+
+
+def bench_transaction_ids(histories, workdir, checkouts=200):
+    """Time checkouts against growing order histories, and the old transactions.txt ID scan."""
+    results = []
+    line = {"ID": 1, "Name": "Product 1", "Price": 1.0, "Quantity": 1}
+    for history in histories:
+        store = server.VendingStore(os.path.join(workdir, f"history_{history}.db"))
+        with store.conn:
+            store.conn.executemany(
+                "INSERT INTO orders (transaction_id, total, created_at) VALUES (?, 1.0, 0)",
+                ((f"{i:032x}",) for i in range(history)),
+            )
+
+        latencies = []
+        for _ in range(checkouts):
+            start = time.perf_counter()
+            store.record_checkout(None, [line])
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        store.close()
+
+        # The ID scan save_transaction used to do on every checkout
+        log_file = os.path.join(workdir, f"history_{history}.txt")
+        with open(log_file, "w") as file:
+            file.writelines(f"Transaction ID: {i:032x}\n" for i in range(history))
+
+        def scan():
+            with open(log_file) as file:
+                return {line.split(":")[1].strip() for line in file if line.startswith("Transaction ID:")}
+
+        results.append({
+            "benchmark": "transaction_ids",
+            "history": history,
+            "checkout_p50_s": latencies[len(latencies) // 2],
+            "checkout_p99_s": latencies[int(len(latencies) * 0.99)],
+            "text_scan_s": timed(scan, repeat=1),
+        })
+        os.remove(log_file)
+    return results
+
+
+def bench_checkout(orders, writer_counts, workdir):
+    """Durable checkouts per second, one commit and fsync per order vs the group-commit pipeline."""
+    results = []
+    line = {"ID": 1, "Name": "Product 1", "Price": 1.0, "Quantity": 1}
+    for mode in ("per_order", "group"):
+        for writers in writer_counts:
+            database = os.path.join(workdir, f"checkout_{mode}_{writers}.db")
+            log_file = os.path.join(workdir, f"checkout_{mode}_{writers}.log")
+            store = server.VendingStore(database)
+            log = server.TransactionLog(log_file, os.path.join(workdir, f"archive_{mode}_{writers}"))
+            pipeline = server.CheckoutPipeline(store, log).start()
+            payment = {"type": "Visa", "card": mask_card("4000123412341234")}
+
+            def one_at_a_time():
+                # What checkout did before the pipeline: its own full-sync commit and fsync per order
+                with store.lock:
+                    store.conn.execute("PRAGMA synchronous=FULL")
+                transaction_id = store.record_checkout(None, [line], 1.0)
+                created_at = time.time()
+                log.append([(transaction_id, created_at, encode_record(transaction_id, created_at, 1.0, [line], payment))])
+
+            def writer():
+                for _ in range(orders // writers):
+                    if mode == "per_order":
+                        one_at_a_time()
+                    else:
+                        pipeline.submit([line], 1.0, payment).result()
+
+            threads = [threading.Thread(target=writer) for _ in range(writers)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            pipeline.stop()
+            store.close()
+
+            done = orders // writers * writers
+            results.append({
+                "benchmark": "checkout",
+                "mode": mode,
+                "writers": writers,
+                "orders_per_s": done / elapsed,
+                "mean_batch": pipeline.committed / pipeline.batches if pipeline.batches else 1,
+            })
+    return results
+
+
+def legacy_receipt(transaction_id, lines, total):
+    """A receipt in the free-form text complete_payment used to write."""
+    text = f"\n\nTransaction ID: {transaction_id}\nPayment Type: Visa\nCard Number: 4000123412341234\n"
+    text += f"Cart Total: £{total:.2f}\nCart Items:\n"
+    for line in lines:
+        text += (f"  - ID: {line['ID']}, Name: {line['Name']}, Quantity: {line['Quantity']}, "
+                 f"Total: £{line['Price'] * line['Quantity']:.2f}\n")
+    return text + "\n"
+
+
+def parse_legacy_receipts(filename):
+    """Units sold per product from the text log, read line by line the way a report had to."""
+    units = {}
+    with open(filename, encoding="utf-8") as file:
+        for line in file:
+            if line.startswith("  - ID:"):
+                fields = dict(part.split(": ", 1) for part in line.strip()[2:].split(", "))
+                product_id = int(fields["ID"])
+                units[product_id] = units.get(product_id, 0) + int(fields["Quantity"])
+    return units
+
+
+def bench_records(counts, workdir):
+    """Scan and decode the structured transaction log against parsing the old text receipts."""
+    results = []
+    lines = [{"ID": i, "Name": f"Product {i}", "Price": 1.5, "Quantity": 2} for i in range(1, 4)]
+    for count in counts:
+        record_file = os.path.join(workdir, f"records_{count}.log")
+        text_file = os.path.join(workdir, f"records_{count}.txt")
+        with open(record_file, "wb") as records, open(text_file, "w", encoding="utf-8") as text:
+            for number in range(count):
+                records.write(encode_record(f"{number:032x}", float(number), 9.0, lines))
+                text.write(legacy_receipt(f"{number:032x}", lines, 9.0))
+
+        def scan():
+            with RecordReader(record_file) as reader:
+                return sum(1 for _ in reader.scan())
+
+        def decode():
+            units = {}
+            with RecordReader(record_file) as reader:
+                for record in reader.records():
+                    for line in record["lines"]:
+                        units[line["ID"]] = units.get(line["ID"], 0) + line["Quantity"]
+            return units
+
+        results.append({
+            "benchmark": "records",
+            "orders": count,
+            "record_bytes": os.path.getsize(record_file),
+            "text_bytes": os.path.getsize(text_file),
+            "scan_s": timed(scan),
+            "decode_s": timed(decode),
+            "text_parse_s": timed(lambda: parse_legacy_receipts(text_file)),
+        })
+        os.remove(record_file)
+        os.remove(text_file)
+    return results
+
+
+def make_sales_history(database, lines, products=200, lines_per_order=3):
+    """Fill a database with `lines` line items spread over a year of orders."""
+    store = server.VendingStore(database)
+    orders = lines // lines_per_order
+    start = time.time() - 365 * 24 * 3600
+    step = 365 * 24 * 3600 / max(orders, 1)
+    with store.conn:
+        store.conn.executemany(
+            "INSERT INTO orders (transaction_id, total, created_at) VALUES (?, 4.5, ?)",
+            ((f"{order:032x}", start + order * step) for order in range(orders)),
+        )
+        store.conn.executemany(
+            "INSERT INTO transactions (transaction_id, product_id, name, price, quantity, created_at) "
+            "VALUES (?, ?, ?, 1.5, 1, ?)",
+            ((f"{line // lines_per_order:032x}", 1 + line % products, f"Product {1 + line % products}",
+              start + line // lines_per_order * step) for line in range(orders * lines_per_order)),
+        )
+    return store
+
+
+def bench_analytics(line_counts, workdir):
+    """Time the sales reports, the rollup rebuild and a checkout over growing line item histories."""
+    results = []
+    for lines in line_counts:
+        database = os.path.join(workdir, f"sales_{lines}.db")
+        store = make_sales_history(database, lines)
+        rebuild_s = timed(store.rebuild_rollups, repeat=1)  # The history was written behind the rollups' back
+        conn = analytics.connect(database)
+        week = time.time() - 7 * 24 * 3600
+        results.append({
+            "benchmark": "analytics",
+            "line_items": lines,
+            "rebuild_s": rebuild_s,
+            "full_report_s": timed(lambda: analytics.sales_report(conn)),
+            "daily_s": timed(lambda: analytics.daily_sales(conn)),
+            "last_week_s": timed(lambda: analytics.sales_report(conn, start=week), repeat=1),
+            "checkout_s": timed(lambda: store.record_checkout(None, [{"ID": 1, "Name": "Product 1", "Price": 1.5,
+                                                                      "Quantity": 1}])),
+        })
+        store.close()
+        conn.close()
+        os.remove(database)
+    return results
+
+
+def bench_catalog_io(sizes, workdir):
+    """Stream catalogs in and out of the database as CSV and JSON lines."""
+    results = []
+    for size in sizes:
+        for extension in ("csv", "jsonl"):
+            source = os.path.join(workdir, f"catalog_{size}.{extension}")
+            catalog.export_catalog(source, (dict(item, ID=None if item["ID"] % 10 == 0 else item["ID"])
+                                            for item in make_catalog(size)))
+            with open(source, "a") as file:  # A few bad rows to reject
+                file.write("x,Bad,1,1\n" if extension == "csv" else "not json\n")
+
+            store = server.VendingStore(os.path.join(workdir, f"catalog_{size}_{extension}.db"))
+            imported = catalog.import_catalog(source, store.upsert_products, 1)
+            exported = catalog.export_catalog(source + ".out", store.iter_products())
+            store.close()
+            results.append({
+                "benchmark": "catalog_io",
+                "format": extension,
+                "rows": size,
+                "import_rows_per_s": imported["rows_per_s"],
+                "export_rows_per_s": exported["rows_per_s"],
+                "rejected": imported["rejected"],
+            })
+            for path in (source, source + ".out", source + ".rejected"):
+                os.remove(path)
+    return results
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind((server.HOST, 0))
+        return probe.getsockname()[1]
+
+
+async def connect_clients(port, total, concurrency, timeout):
+    """Open `total` connections, `concurrency` at a time, doing the client ID handshake on each."""
+    limit = asyncio.Semaphore(concurrency)
+    completed = 0
+
+    async def one_client(number):
+        nonlocal completed
+        async with limit:
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(server.HOST, port), timeout)
+                writer.write(encode_frame(PUSH_ID, str(100000 + number)))
+                decoder = FrameDecoder()
+                welcome = []
+                while not welcome:  # The welcome message may arrive over several reads
+                    data = await asyncio.wait_for(reader.read(server.BUFSIZE), timeout)
+                    if not data:
+                        raise ConnectionResetError("closed before the welcome message")
+                    welcome = decoder.feed(data)
+                writer.close()
+                completed += 1
+            except (asyncio.TimeoutError, OSError, ValueError):
+                pass
+
+    await asyncio.gather(*(one_client(number) for number in range(total)))
+    return completed
+
+
+def bench_connections(total, concurrency, stalled, timeout=5, connect_timeout=1):
+    """Handshakes per second for the threaded and asyncio servers, with `stalled` silent clients connected first.
+
+    The threaded server only has a backlog of 10 and stops accepting while it
+    waits on a silent client, so silent connects beyond that time out after
+    connect_timeout and are counted rather than failing the run.
+    """
+    server.SERVER_VERBOSE = False  # Its threads outlive this benchmark, so redirecting stdout is not enough
+    results = []
+    for mode in ("threaded", "asyncio"):
+        port = free_port()
+        if mode == "threaded":
+            server.PORT = port  # start_server reads the module settings
+            target = server.start_server
+        else:
+            async_server = server.AsyncVendingServer(port=port, verbose=False)
+            target = async_server.run
+        with contextlib.redirect_stdout(io.StringIO()):  # Both servers print per connection
+            threading.Thread(target=target, daemon=True).start()
+            time.sleep(0.2)
+
+            # Clients that connect and never send their ID
+            silent = []
+            for _ in range(stalled):
+                try:
+                    silent.append(socket.create_connection((server.HOST, port), timeout=connect_timeout))
+                except OSError:
+                    pass
+
+            start = time.perf_counter()
+            completed = asyncio.run(connect_clients(port, total, concurrency, timeout))
+            elapsed = time.perf_counter() - start
+
+            for sock in silent:
+                sock.close()
+            time.sleep(0.1)
+        results.append({
+            "benchmark": "connections",
+            "mode": mode,
+            "clients": total,
+            "concurrency": concurrency,
+            "stalled_clients": stalled,
+            "stalled_connected": len(silent),
+            "completed": completed,
+            "connections_per_s": completed / elapsed,
+        })
+    return results
+
+
+def bench_protocol(total, batches):
+    """Request/reply rate over one connection for different pipeline depths."""
+    async_server = server.AsyncVendingServer(port=0, verbose=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        threading.Thread(target=async_server.run, daemon=True).start()
+        async_server.ready.wait()
+
+        results = []
+        with socket.create_connection((server.HOST, async_server.port)) as sock:
+            client.set_client_id(sock)
+            decoder = FrameDecoder()
+            recv_messages(sock, decoder, server.BUFSIZE)  # Welcome message
+            for batch in batches:
+                start = time.perf_counter()
+                for _ in range(total // batch):
+                    client.request(sock, decoder, ["PING"] * batch)
+                elapsed = time.perf_counter() - start
+                results.append({
+                    "benchmark": "protocol",
+                    "pipeline_depth": batch,
+                    "messages": total // batch * batch,
+                    "messages_per_s": total // batch * batch / elapsed,
+                })
+    async_server.stop()
+    return results
+
+
+def bench_contention(thread_counts, operations, skus=(1, 1000)):
+    """Concurrent buyers adding to carts and checking out, with one global lock and with striped locks.
+
+    Stock is set so buyers run out part way through, then the books are checked:
+    units sold plus units left must equal what was there at the start.
+    """
+    results = []
+    for sku_count in skus:
+        for stripes in (1, server.LOCK_STRIPES):
+            for threads in thread_counts:
+                engine = server.VendingEngine(hold_ttl=None, stripes=stripes)
+                items = make_catalog(sku_count)
+                starting = threads * operations // 2  # Not enough for every add to succeed
+                for item in items:
+                    item["Quantity"] = starting // sku_count + 1
+                engine.load(items)
+                before = sum(item["Quantity"] for item in items)
+                sold = [0] * threads
+                start_line = threading.Barrier(threads)
+
+                def buyer(number):
+                    cart_id = f"buyer{number}"
+                    start_line.wait()
+                    for operation in range(operations):
+                        engine.add_to_cart(1 + (number * 7919 + operation) % sku_count, 1, cart_id)
+                        if operation % 5 == 4:
+                            lines, _ = engine.checkout(cart_id)
+                            sold[number] += sum(line["Quantity"] for line in lines)
+                    lines, _ = engine.checkout(cart_id)
+                    sold[number] += sum(line["Quantity"] for line in lines)
+
+                workers = [threading.Thread(target=buyer, args=(number,)) for number in range(threads)]
+                start = time.perf_counter()
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                elapsed = time.perf_counter() - start
+
+                after = sum(item["Quantity"] for item in items)
+                results.append({
+                    "benchmark": "contention",
+                    "skus": sku_count,
+                    "stripes": stripes,
+                    "threads": threads,
+                    "ops_per_s": threads * operations / elapsed,
+                    "sold": sum(sold),
+                    "consistent": sum(sold) + after == before and min(item["Quantity"] for item in items) >= 0,
+                })
+    return results
+
+
+def legacy_payment_rewrite(cart):
+    """What complete_payment used to do per order: re-parse inventory.txt and rewrite all of it."""
+    with open(server.INVENTORY_FILE, "r") as file:
+        inventory_data = [line.strip() for line in file.readlines()]
+    updated_inventory = []
+    for line in inventory_data:
+        parts = line.split(", ")
+        item_id = int(parts[0].split(": ")[1])
+        quantity = int(parts[3].split(": ")[1])
+        if item_id in cart:
+            quantity = max(quantity - cart[item_id]["Quantity"], 0)
+        updated_inventory.append(
+            f"ID: {item_id}, Name: {parts[1].split(': ')[1]}, Price: {float(parts[2].split(': ')[1]):.2f}, "
+            f"Quantity: {quantity}")
+    with open(server.INVENTORY_FILE, "w") as file:
+        file.write("\n".join(updated_inventory))
+
+
+def bench_hot_paths(sizes, workdir, operations=200):
+    """Time the inventory, cart and checkout paths against synthetic catalogs, with no GUI."""
+    results = []
+    cwd = os.getcwd()
+    saved = (server.STORAGE_BACKEND, server.INVENTORY_JOURNAL, server.store, server.inventory_journal,
+             server.transaction_log, list(server.engine.listeners))
+
+    def record(path, size, seconds, ops=1):
+        results.append({"benchmark": "hot_paths", "path": path, "catalog": size,
+                        "seconds_per_op": seconds / ops, "ops_per_s": ops / seconds if seconds else float("inf")})
+
+    def per_op(function, ops):
+        start = time.perf_counter()
+        for number in range(ops):
+            function(number)
+        return time.perf_counter() - start
+
+    try:
+        for size in sizes:
+            directory = os.path.join(workdir, f"hot_{size}")
+            os.makedirs(directory)
+            os.chdir(directory)  # The server module uses relative file names
+            # save_transaction appends through the module's log, which keeps its file open, so each size gets its own
+            server.transaction_log = server.TransactionLog(os.path.join(directory, server.TRANSACTION_LOG),
+                                                           os.path.join(directory, server.TRANSACTION_ARCHIVE))
+            items = make_catalog(size)
+            for item in items:
+                item["Quantity"] = 10 ** 9  # Never run out during the run
+            write_catalog(server.INVENTORY_FILE, items)
+            server.engine.listeners.clear()
+
+            # Text storage: loading, full rewrites and per-change journal appends
+            server.STORAGE_BACKEND, server.INVENTORY_JOURNAL, server.store = "text", True, None
+            server.inventory_journal = server.InventoryJournal(lambda: server.inventory.values())
+
+            def cold_load():
+                server._parse_cache.clear()
+                server.Product().load_inventory()
+
+            record("load_inventory_text_cold", size, timed(cold_load))
+            record("load_inventory_text_cached", size, timed(server.Product().load_inventory))
+            record("update_inventory_file_text", size, timed(server.update_inventory_file))
+            record("get_product_list", size, timed(server.get_product_list))
+
+            server.engine.listeners.append(server.inventory_journal.append)
+            record("add_to_cart_journal", size,
+                   per_op(lambda n: server.engine.add_to_cart(n % size + 1), operations), operations)
+            server.engine.clear_cart()
+            server.inventory_journal.rewrite(server.inventory.values())
+            server.engine.listeners.clear()
+
+            # The whole-file rewrite every click used to cost
+            legacy_ops = max(1, min(operations, 2000000 // size))
+            server.engine.listeners.append(lambda items: server.update_inventory_file())
+            server.INVENTORY_JOURNAL = False
+            record("add_to_cart_full_rewrite", size,
+                   per_op(lambda n: server.engine.add_to_cart(n % size + 1), legacy_ops), legacy_ops)
+            server.engine.clear_cart()
+            server.engine.listeners.clear()
+            cart = {item["ID"]: dict(item, Quantity=1) for item in items[:5]}
+            record("complete_payment_legacy_rewrite", size,
+                   per_op(lambda n: legacy_payment_rewrite(cart), legacy_ops), legacy_ops)
+
+            # SQLite storage
+            server.STORAGE_BACKEND = "sqlite"
+            server.store = server.VendingStore(server.DATABASE_FILE)
+            server.store.save_products(items)
+            record("load_inventory_sqlite", size, timed(server.Product().load_inventory))
+            record("update_inventory_file_sqlite", size, timed(server.update_inventory_file))
+
+            server.engine.listeners.append(server.store.save_stock)
+            record("add_to_cart_sqlite", size,
+                   per_op(lambda n: server.engine.add_to_cart(n % size + 1), operations), operations)
+            server.engine.clear_cart()
+
+            # Refilling a quarter of the catalog: one planned save, against one save per item
+            par_levels = {item["ID"]: 10 ** 9 for item in items}
+
+            def sell_out():
+                for item_id in range(1, size + 1, 4):
+                    server.inventory[item_id]["Quantity"] = 0
+
+            def restock_all():
+                server.apply_restock(server.plan_restock(server.inventory.values(), par_levels))
+
+            def restock_per_item():
+                for line in server.plan_restock(server.inventory.values(), par_levels):
+                    server.engine.restock(line["ID"], line["Par"])
+
+            sell_out()
+            record("restock_all_sqlite", size, timed(restock_all, repeat=1))
+            sell_out()
+            record("restock_per_item_sqlite", size, timed(restock_per_item, repeat=1))
+
+            def checkout(number):
+                for offset in range(5):
+                    server.engine.add_to_cart((number * 5 + offset) % size + 1)
+                lines, total = server.engine.checkout()
+                server.store.record_checkout(None, lines, total)
+
+            record("checkout_sqlite", size, per_op(checkout, operations), operations)
+            record("save_transaction", size,
+                   per_op(lambda n: server.Product().save_transaction(cart, 5.0, server.store.conn, None), operations),
+                   operations)
+            server.engine.listeners.clear()
+            server.store.close()
+            server.transaction_log.wait()
+    finally:
+        os.chdir(cwd)
+        (server.STORAGE_BACKEND, server.INVENTORY_JOURNAL, server.store, server.inventory_journal,
+         server.transaction_log, listeners) = saved
+        server.engine.listeners[:] = listeners
+    return results
+
+
+def print_results(results):
+    for result in results:
+        print(", ".join(f"{key}: {value:.6f}" if isinstance(value, float) else f"{key}: {value}"
+                        for key, value in result.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vending machine hot paths without the GUI.")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--catalogs", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="catalog sizes for the hot path benchmark (1000000 works, slowly)")
+    parser.add_argument("--operations", type=int, default=200, help="operations timed per hot path")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 250000],
+                        help="catalog sizes for the parser benchmark")
+    parser.add_argument("--histories", type=int, nargs="+", default=[1000, 100000, 1000000],
+                        help="past order counts for the transaction ID benchmark (10000000 works, slowly)")
+    parser.add_argument("--clients", type=int, default=2000, help="connections for the server benchmark")
+    parser.add_argument("--concurrency", type=int, default=200, help="connections open at once")
+    parser.add_argument("--stalled", type=int, default=0,
+                        help="silent clients connected before the server benchmark starts")
+    parser.add_argument("--messages", type=int, default=20000, help="requests for the protocol benchmark")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16],
+                        help="buyer thread counts for the contention benchmark")
+    parser.add_argument("--catalog-rows", type=int, nargs="+", default=[10000, 300000],
+                        help="catalog sizes for the import/export benchmark")
+    parser.add_argument("--line-items", type=int, nargs="+", default=[100000, 1000000],
+                        help="sales history sizes for the analytics benchmark (10000000 works, slowly)")
+    parser.add_argument("--records", type=int, nargs="+", default=[10000, 100000],
+                        help="order counts for the transaction record benchmark")
+    parser.add_argument("--orders", type=int, default=2000, help="orders for the checkout benchmark")
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 8, 64],
+                        help="concurrent checkouts for the checkout benchmark")
+    parser.add_argument("--json", metavar="FILE", help="write every result to FILE as JSON")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.only:
+            rows = BENCHMARKS[name](args, workdir)
+            print_results(rows)
+            results.extend(rows)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({
+                "python": platform.python_version(),
+                "sqlite": server.sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, file, indent=2)
+
+
+BENCHMARKS = {
+    "hot_paths": lambda args, workdir: bench_hot_paths(args.catalogs, workdir, args.operations),
+    "parser": lambda args, workdir: bench_parser(args.sizes, workdir),
+    "transaction_ids": lambda args, workdir: bench_transaction_ids(args.histories, workdir),
+    "connections": lambda args, workdir: bench_connections(args.clients, args.concurrency, args.stalled),
+    "protocol": lambda args, workdir: bench_protocol(args.messages, [1, 10, 100]),
+    "catalog_io": lambda args, workdir: bench_catalog_io(args.catalog_rows, workdir),
+    "analytics": lambda args, workdir: bench_analytics(args.line_items, workdir),
+    "records": lambda args, workdir: bench_records(args.records, workdir),
+    "checkout": lambda args, workdir: bench_checkout(args.orders, args.writers, workdir),
+    "contention": lambda args, workdir: bench_contention(args.threads, args.operations * 10),
+}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import csv
+import json
+import math
+import os
+import time
+
+# Catalog files are CSV with an ID,Name,Price,Quantity header, or JSON lines (.jsonl or
+# .ndjson) with the same keys; the format is picked from the file extension. Rows are
+# streamed one at a time, so only the current batch is ever held in memory.
+FIELDS = ("ID", "Name", "Price", "Quantity")
+IMPORT_BATCH = 5000  # Rows saved per commit during an import
+REJECTED_SHOWN = 20  # Rejected rows kept in the report; all of them go to the .rejected file
+
+
+def is_jsonl(path):
+    return path.lower().endswith((".jsonl", ".ndjson"))
+
+
+def read_rows(file, path):
+    """Yield (line number, raw row dict) from an open catalog file."""
+    if is_jsonl(path):
+        for number, line in enumerate(file, start=1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as error:
+                    row = error  # Reported as a rejected row, not a failed import
+                yield number, row
+    else:
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def validate_row(row):
+    """Turn a raw row into an item dict, or raise ValueError saying what is wrong. A blank ID means new."""
+    if isinstance(row, Exception):
+        raise ValueError(f"not valid JSON ({row})")
+    if not isinstance(row, dict):
+        raise ValueError("not an object")
+
+    raw_id = row.get("ID")
+    item_id = None
+    if raw_id not in (None, ""):
+        try:
+            item_id = int(raw_id)
+        except (TypeError, ValueError):
+            raise ValueError(f"ID {raw_id!r} is not a whole number") from None
+        if item_id <= 0:
+            raise ValueError(f"ID {item_id} must be positive")
+
+    name = str(row.get("Name") or "").strip()
+    if not name:
+        raise ValueError("Name is missing")
+    if "\n" in name or "\r" in name:
+        raise ValueError("Name spans more than one line")
+
+    try:
+        price = float(row.get("Price"))
+    except (TypeError, ValueError):
+        raise ValueError(f"Price {row.get('Price')!r} is not a number") from None
+    if not math.isfinite(price) or price < 0:
+        raise ValueError(f"Price {price} must be 0 or more")
+
+    try:
+        quantity = int(row.get("Quantity"))
+    except (TypeError, ValueError):
+        raise ValueError(f"Quantity {row.get('Quantity')!r} is not a whole number") from None
+    if quantity < 0:
+        raise ValueError(f"Quantity {quantity} must be 0 or more")
+
+    return {"ID": item_id, "Name": name, "Price": round(price, 2), "Quantity": quantity}
+
+
+def import_catalog(path, save_batch, next_id, batch_size=IMPORT_BATCH):
+    """Stream a catalog file into save_batch(items), batch_size valid rows at a time.
+
+    Rows without an ID are numbered from next_id, kept above every ID seen so
+    far in the file. Rejected rows are written to path + ".rejected" with their
+    line number and reason. Returns a report with the row counts, the time
+    taken, throughput and the first rejected rows.
+    """
+    report = {"rows": 0, "imported": 0, "rejected": 0, "rejected_rows": [], "rejected_file": path + ".rejected"}
+    start = time.perf_counter()
+    batch = []
+    with open(path, newline="", encoding="utf-8-sig") as file, \
+            open(report["rejected_file"], "w", encoding="utf-8") as rejected:
+        for number, row in read_rows(file, path):
+            report["rows"] += 1
+            try:
+                item = validate_row(row)
+            except ValueError as error:
+                report["rejected"] += 1
+                rejected.write(f"line {number}: {error}\n")
+                if len(report["rejected_rows"]) < REJECTED_SHOWN:
+                    report["rejected_rows"].append((number, str(error)))
+                continue
+            if item["ID"] is None:
+                item["ID"] = next_id
+            next_id = max(next_id, item["ID"] + 1)
+            batch.append(item)
+            if len(batch) >= batch_size:
+                save_batch(batch)
+                report["imported"] += len(batch)
+                batch = []
+        if batch:
+            save_batch(batch)
+            report["imported"] += len(batch)
+
+    if not report["rejected"]:
+        os.remove(report["rejected_file"])
+        report["rejected_file"] = None
+    report["seconds"] = time.perf_counter() - start
+    report["rows_per_s"] = report["rows"] / report["seconds"] if report["seconds"] else 0.0
+    return report
+
+
+def export_catalog(path, items):
+    """Stream items to a catalog file. Returns the row count, the time taken and throughput."""
+    start = time.perf_counter()
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        if is_jsonl(path):
+            for item in items:
+                file.write(json.dumps({field: item[field] for field in FIELDS}) + "\n")
+                count += 1
+        else:
+            writer = csv.writer(file)
+            writer.writerow(FIELDS)
+            for item in items:
+                writer.writerow([item["ID"], item["Name"], f"{item['Price']:.2f}", item["Quantity"]])
+                count += 1
+    seconds = time.perf_counter() - start
+    return {"rows": count, "seconds": seconds, "rows_per_s": count / seconds if seconds else 0.0}
@@ -1,45 +1,161 @@
+import argparse
+import asyncio
+import json
+import re
 import socket
+import sys
 import threading
 import time
 import random
 
+from PROTOCOL import PUSH_ID, FrameDecoder, encode_frame, encode_frames, recv_messages
+
 # Server configuration
 HOST = '127.0.0.1'
 PORT = 5000
 BUFSIZE = 2048
+ACTIVITY_FILE = "activity_{client_id}.json"  # Where the activity summary is written on disconnect
+
+# Upper bounds, in seconds, of the latency histogram buckets. The last bucket catches everything above.
+HISTOGRAM_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram. Memory use does not grow with the number of samples."""
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = 0
+        while index < len(self.buckets) and seconds > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
 
-# Dictionary to track user activity
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of samples."""
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+        return 0.0
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+            "buckets": dict(zip([str(bound) for bound in self.buckets] + ["inf"], self.counts)),
+        }
+
+
+# Time spent on each page, per client: client ID -> {page: Histogram}
 user_activity = {}
+# Request round trips, per command: command -> Histogram
+round_trips = {}
+# Requests waiting for a reply: message ID -> (command, time sent)
+in_flight = {}
+# The page the user is on and when they got there
+current_page = None
+page_entered_at = None
 
 client_id = random.randint(100000, 999999)  # Generate a random client ID
+next_message_id = 1  # Message IDs for requests sent to the server
+
+# Live view of the server's stock: item ID -> (quantity, version)
+live_stock = {}
 
 
 def track_activity(client_id, page):
-    """Track the page a user accesses and the time spent."""
-    start_time = time.time()
+    """Track the page a user accesses and the time spent on the page before it."""
+    global current_page, page_entered_at
+    now = time.monotonic()
 
-    # Calculate duration
-    duration = time.time() - start_time
+    # The previous page lasted until this command arrived
+    if current_page is not None:
+        pages = user_activity.setdefault(client_id, {})
+        pages.setdefault(current_page, Histogram()).record(now - page_entered_at)
 
-    # Update activity log
-    user_activity[client_id] = user_activity.get(client_id, [])
-    user_activity[client_id].append((page, duration))
+    current_page = page
+    page_entered_at = now
 
 
 def log_user_activity(client_id):
-    """Log the activity of a user."""
+    """Log the activity of a user and export the summary to a JSON file."""
+    track_activity(client_id, None)  # Close off the page the user was on
+
+    summary = {
+        "client_id": client_id,
+        "pages": {page: histogram.summary() for page, histogram in user_activity.get(client_id, {}).items()},
+        "round_trips": {command: histogram.summary() for command, histogram in round_trips.items()},
+    }
+
     print(f"\nUser {client_id} Activity:")
-    for page, start_time in user_activity.get(client_id, []):
-        duration = time.time() - start_time
-        print(f" - Page: {page}, Time Spent: {duration:.2f} seconds")
+    for page, stats in summary["pages"].items():
+        print(f" - Page: {page}, Visits: {stats['count']}, Total Time: {stats['mean'] * stats['count']:.2f} seconds, "
+              f"p95: {stats['p95']:.2f} seconds")
+    for command, stats in summary["round_trips"].items():
+        print(f" - Request: {command}, Count: {stats['count']}, Mean Round Trip: {stats['mean'] * 1000:.2f} ms")
+
+    with open(ACTIVITY_FILE.format(client_id=client_id), "w") as file:
+        json.dump(summary, file, indent=2)
 
 # Dictionary of client responses for each server command
 def set_client_id(client_socket):
     """Send the client ID to the server."""
     global client_id
-    client_socket.sendall(str(client_id).encode('utf-8'))
+    client_socket.sendall(encode_frame(PUSH_ID, str(client_id)))
     print(f"Client ID: {client_id} set.")
 
+def send_commands(client_socket, commands):
+    """Send several commands to the server in one write and return their message IDs."""
+    global next_message_id
+    messages = []
+    sent_at = time.monotonic()
+    for command in commands:
+        messages.append((next_message_id, command))
+        in_flight[next_message_id] = (command.split(" ", 1)[0].upper(), sent_at)
+        next_message_id += 1
+    client_socket.sendall(encode_frames(messages))
+    return [message_id for message_id, _ in messages]
+
+def record_round_trip(message_id, received_at):
+    """Record how long the request with message_id took to be answered."""
+    request_sent = in_flight.pop(message_id, None)
+    if request_sent is not None:
+        command, sent_at = request_sent
+        round_trips.setdefault(command, Histogram()).record(received_at - sent_at)
+
+def request(client_socket, decoder, commands):
+    """Send commands pipelined and wait for every reply. Returns the replies in order."""
+    message_ids = send_commands(client_socket, commands)
+    wanted = set(message_ids)
+    replies = {}
+    while len(replies) < len(message_ids):
+        messages = recv_messages(client_socket, decoder, BUFSIZE)
+        if messages is None:
+            raise ConnectionError("Server disconnected.")
+        received_at = time.monotonic()
+        for message_id, text in messages:
+            if message_id == PUSH_ID:
+                handle_server_command(text)
+            elif message_id in wanted:
+                replies[message_id] = text
+                record_round_trip(message_id, received_at)
+    return [replies[message_id] for message_id in message_ids]
+
 def respond_to_command(command):
     """Respond to a command from the server."""
     responses = {
@@ -54,6 +170,46 @@ def respond_to_command(command):
     }
     return responses.get(command.upper(), "Unknown command")
 
+def apply_stock_update(words):
+    """Apply "ID:Quantity:Version" words to live_stock. Returns the number of items that changed."""
+    changed = 0
+    for word in words.split():
+        item_id, quantity, version = (int(part) for part in word.split(":"))
+        current = live_stock.get(item_id)
+        if current is None or version > current[1]:  # Ignore updates older than what we have
+            live_stock[item_id] = (quantity, version)
+            changed += 1
+    return changed
+
+def handle_server_command(command):
+    """Handle a command pushed by the server. Returns True if the server asked the client to exit."""
+    if command.startswith("STOCK "):
+        changed = apply_stock_update(command[len("STOCK "):])
+        print(f"Stock update: {changed} item(s) changed")
+        return False
+
+    print(f"Server sent command: {command}")
+
+    track_activity(client_id, command)
+
+    # Get the response for the command
+    response = respond_to_command(command)
+    print(response)
+
+    return command.upper() == "EXIT"
+
+def read_user_commands(client_socket):
+    """Send each command the user types to the server. The replies are printed by main()."""
+    print("Type ADD <item ID> [quantity], REMOVE <item ID>, CART, CHECKOUT or VIEW, or EXIT to leave.")
+    for line in sys.stdin:
+        command = line.strip()
+        if not command:
+            continue
+        try:
+            send_commands(client_socket, [command])
+        except OSError:
+            return  # The connection has gone; main() reports it
+
 def main():
     try:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
@@ -61,27 +217,37 @@ def main():
             print(f"Connected to server at {HOST}:{PORT}")
 
             set_client_id(client_socket)
-            initial_response = client_socket.recv(BUFSIZE).decode('utf-8').strip()
-            print(initial_response)
+            decoder = FrameDecoder()
+            messages = recv_messages(client_socket, decoder, BUFSIZE)
+            if messages:
+                print(messages.pop(0)[1])  # The server's welcome message
 
-            while True:
-                # Receive command from the server
-                command = client_socket.recv(BUFSIZE).decode('utf-8').strip()
-                if not command:
-                    print("Server disconnected.")
-                    break
+            # Ask for the current stock and for live updates after it
+            send_commands(client_socket, ["SUBSCRIBE"])
 
-                print(f"Server sent command: {command}")
+            # Let the user shop from the keyboard while server messages are handled below
+            threading.Thread(target=read_user_commands, args=(client_socket,), daemon=True).start()
 
-                track_activity(client_id, command)
+            while messages is not None:
+                # One read can carry several framed messages
+                received_at = time.monotonic()
+                for message_id, text in messages:
+                    command = text.strip()
+                    if message_id != PUSH_ID:
+                        record_round_trip(message_id, received_at)
+                    if command.startswith("SNAPSHOT"):
+                        apply_stock_update(command[len("SNAPSHOT"):])
+                        print(f"Live stock view loaded: {len(live_stock)} items")
+                    elif message_id != PUSH_ID:
+                        print(f"Reply to message {message_id}: {command}")
+                    elif command and handle_server_command(command):
+                        print("Server requested exit. Closing connection...")
+                        return
 
-                # Get the response and send it back to the server
-                response = respond_to_command(command)
-                print(response)
+                # Receive commands from the server
+                messages = recv_messages(client_socket, decoder, BUFSIZE)
 
-                if command.upper() == "EXIT":
-                    print("Server requested exit. Closing connection...")
-                    break
+            print("Server disconnected.")
     except Exception as e:
         print(f"Error in client: {e}")
     finally:
@@ -89,7 +255,125 @@ def main():
         print("Client disconnected.")
 
 
+# Commands each simulated client sends per session; {item} is replaced by a product ID picked per session
+LOAD_SESSION_SCRIPT = ("VIEW", "ADD {item}", "ADD {item}", "CART", "REMOVE {item}", "ADD {item}",
+                       "CHECKOUT", "ORDER COMPLETE", "MAIN MENU")
+
+
+async def read_reply(reader, decoder, message_id, pending):
+    """Read frames until the reply to message_id arrives. Pushed commands and stray replies go in pending."""
+    while message_id not in pending:
+        data = await reader.read(BUFSIZE)
+        if not data:
+            raise ConnectionError("Server disconnected.")
+        for reply_id, text in decoder.feed(data):
+            if reply_id != PUSH_ID:
+                pending[reply_id] = text
+    return pending.pop(message_id)
+
+
+async def simulated_client(number, sessions, think_time, latencies, errors):
+    """Run scripted shopping sessions over one connection, recording each request's latency."""
+    reader, writer = await asyncio.open_connection(HOST, PORT)
+    decoder = FrameDecoder()
+    pending = {}
+    writer.write(encode_frame(PUSH_ID, str(client_id * 10000 + number)))
+
+    # Wait for the welcome message
+    welcome = []
+    while not welcome:
+        data = await reader.read(BUFSIZE)
+        if not data:
+            raise ConnectionError("Server disconnected.")
+        welcome = decoder.feed(data)
+
+    message_id = 0
+    item_ids = [1]
+    try:
+        for _ in range(sessions):
+            item = random.choice(item_ids)
+            for step in LOAD_SESSION_SCRIPT:
+                command = step.format(item=item)
+                name = step.split(" {")[0]
+                message_id += 1
+                start = time.perf_counter()
+                writer.write(encode_frame(message_id, command))
+                reply = await read_reply(reader, decoder, message_id, pending)
+                latencies.setdefault(name, []).append(time.perf_counter() - start)
+                if reply.startswith("ERROR"):
+                    errors[name] = errors.get(name, 0) + 1
+                elif name == "VIEW":
+                    item_ids = [int(found) for found in re.findall(r"^ID: (\d+)", reply, re.MULTILINE)] or item_ids
+                if think_time:
+                    await asyncio.sleep(random.uniform(0, think_time))
+        message_id += 1
+        writer.write(encode_frame(message_id, "EXIT"))
+        await read_reply(reader, decoder, message_id, pending)
+    finally:
+        writer.close()
+
+
+def percentile(samples, fraction):
+    """Value below which `fraction` of the sorted samples fall."""
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] if samples else 0.0
+
+
+async def run_load_test(clients, sessions, think_time):
+    """Drive `clients` simulated kiosks at once and return per-command throughput and latency."""
+    latencies = {}
+    errors = {}
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(simulated_client(number, sessions, think_time, latencies, errors) for number in range(clients)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "clients": clients,
+        "sessions_per_client": sessions,
+        "failed_clients": sum(1 for result in results if isinstance(result, Exception)),
+        "elapsed_s": elapsed,
+        "requests_per_s": sum(len(samples) for samples in latencies.values()) / elapsed,
+        "commands": {},
+    }
+    for name, samples in latencies.items():
+        samples.sort()
+        report["commands"][name] = {
+            "count": len(samples),
+            "errors": errors.get(name, 0),
+            "per_s": len(samples) / elapsed,
+            "p50_ms": percentile(samples, 0.50) * 1000,
+            "p95_ms": percentile(samples, 0.95) * 1000,
+            "p99_ms": percentile(samples, 0.99) * 1000,
+        }
+    return report
+
+
+def print_load_report(report):
+    print(f"{report['clients']} clients x {report['sessions_per_client']} sessions in {report['elapsed_s']:.2f}s, "
+          f"{report['requests_per_s']:.0f} requests/s, {report['failed_clients']} clients failed")
+    print(f"{'Command':<16}{'Count':>8}{'Errors':>8}{'Per s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in report["commands"].items():
+        print(f"{name:<16}{stats['count']:>8}{stats['errors']:>8}{stats['per_s']:>10.0f}"
+              f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Vending machine client.")
+    parser.add_argument("--load", type=int, metavar="N", help="run N simulated clients against the server instead")
+    parser.add_argument("--sessions", type=int, default=5, help="shopping sessions per simulated client")
+    parser.add_argument("--think", type=float, default=0.0, help="maximum random pause between commands, in seconds")
+    parser.add_argument("--json", metavar="FILE", help="also write the load report to FILE")
+    args = parser.parse_args()
+
+    if args.load:
+        load_report = asyncio.run(run_load_test(args.load, args.sessions, args.think))
+        print_load_report(load_report)
+        if args.json:
+            with open(args.json, "w") as report_file:
+                json.dump(load_report, report_file, indent=2)
+    else:
+        main()
 
 
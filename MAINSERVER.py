@@ -1,40 +1,505 @@
 import tkinter as tk
-from tkinter import IntVar, messagebox, ttk
+from tkinter import IntVar, filedialog, messagebox, ttk
+import asyncio
+import gzip
+import json
+import os
+import shutil
 import socket
 import threading
 import sqlite3
 import re
+import heapq
+from collections import deque
+import queue
+import time
 import uuid  # To generate unique transaction IDs
+from concurrent.futures import Future
+
+import ANALYTICS as analytics
+import CATALOG as catalog
+from PROTOCOL import PUSH_ID, FrameDecoder, encode_frame, encode_frames, recv_messages
+from RECORDS import HEADER as RECORD_HEADER, RecordReader, encode_record, mask_card
 
 # Server configuration
 HOST = '127.0.0.1'
 PORT = 5000
 BUFSIZE = 2048
+SERVER_MODE = "asyncio"  # "asyncio" serves every client from one event loop, "threaded" uses start_server
+SERVER_BACKLOG = 1024
+SERVER_VERBOSE = True  # Print connection events from the threaded server; the benchmark turns this off
+HANDSHAKE_TIMEOUT = 10  # Seconds a new connection has to send its client ID
+OUTBOUND_QUEUE_SIZE = 256  # Pushed frames queued per client before the overflow policy applies
+OUTBOUND_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+OUTBOUND_POLICY = "drop_oldest"  # What to do with pushed commands when a client's queue is full
+SHOPPING_COMMANDS = {  # Commands that work on the client's own cart, with their usage
+    "ADD": "ADD <item ID> [quantity]",
+    "REMOVE": "REMOVE <item ID>",
+    "CART": "CART",
+    "CHECKOUT": "CHECKOUT",
+}
+CLIENT_COMMANDS = ("VIEW", "MAIN MENU", "ADD", "REMOVE", "CART", "CHECKOUT", "ORDER COMPLETE", "EXIT",
+                   "SUBSCRIBE", "UNSUBSCRIBE")
 INVENTORY_FILE = "inventory.txt"
-TRANSACTION_FILE = "transactions.txt"
+FRESH_INVENTORY_FILE = "fresh_inventory.txt"
+TRANSACTION_LOG = "transactions.log"  # Structured records, see RECORDS.py
+TRANSACTION_ARCHIVE = "transactions"  # Sealed, compressed transaction log segments and their index
+TRANSACTION_SEGMENT_BYTES = 1024 * 1024  # Size at which the active transaction log is sealed
+TRANSACTION_SEGMENT_AGE = 24 * 60 * 60  # Seconds after which the active transaction log is sealed
+JOURNAL_FILE = "inventory.journal"
+DATABASE_FILE = "vending_machine.db"
+STORAGE_BACKEND = "sqlite"  # "sqlite" keeps stock in DATABASE_FILE, "text" keeps it in INVENTORY_FILE
+INVENTORY_JOURNAL = True  # Text backend: append stock changes to JOURNAL_FILE instead of rewriting INVENTORY_FILE
+JOURNAL_COMPACT_THRESHOLD = 500  # Journal records written before a background compaction
+RESTOCK_LOW_WATER = 0.25  # Restock All refills items at or below this fraction of their fresh_inventory.txt level
+CART_HOLD_TTL = 15 * 60  # Seconds a cart keeps its stock after the last change; None never expires
+SWEEP_INTERVAL = 5  # Seconds between sweeps for expired carts
+SWEEP_BATCH = 100  # Most carts released in one sweep, so a sweep never holds the lock for long
+LOCK_STRIPES = 64  # Locks shared out across items and carts by VendingEngine
+CHECKOUT_BATCH = 256  # Most orders committed together by the checkout pipeline
+CHECKOUT_WAIT = 0  # Seconds the pipeline lingers for more orders; 0 batches whatever queued during the last write
+
+LOCAL_CART = "local"  # Cart used by the Tk window
+
+
+class ReservationLedger:
+    """When each cart's hold on its stock runs out.
+
+    Deadlines go in a heap so the sweeper only looks at carts that are due.
+    Touching a cart pushes a new entry instead of moving the old one; stale
+    entries are skipped when they reach the top.
+    """
+
+    def __init__(self, ttl=CART_HOLD_TTL):
+        self.ttl = ttl
+        self.deadlines = {}  # cart ID -> time its hold expires
+        self.heap = []  # (deadline, cart ID), may contain stale entries
+        self.lock = threading.Lock()
+
+    def touch(self, cart_id, now=None):
+        """Start or extend the hold for cart_id."""
+        if self.ttl is None:
+            return
+        deadline = (time.monotonic() if now is None else now) + self.ttl
+        with self.lock:
+            self.deadlines[cart_id] = deadline
+            heapq.heappush(self.heap, (deadline, cart_id))
+            if len(self.heap) > 2 * len(self.deadlines) + 64:
+                # Mostly stale entries, rebuild from the live deadlines
+                self.heap = [(deadline, cart_id) for cart_id, deadline in self.deadlines.items()]
+                heapq.heapify(self.heap)
+
+    def release(self, cart_id):
+        """Forget the hold for cart_id, e.g. after checkout."""
+        with self.lock:
+            self.deadlines.pop(cart_id, None)
+
+    def held(self, cart_id):
+        """True if cart_id has a hold that has not been popped by due() or released."""
+        with self.lock:
+            return cart_id in self.deadlines
+
+    def due(self, now=None, limit=SWEEP_BATCH):
+        """Pop up to limit carts whose hold has expired."""
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now and len(expired) < limit:
+                deadline, cart_id = heapq.heappop(self.heap)
+                if self.deadlines.get(cart_id) == deadline:
+                    del self.deadlines[cart_id]
+                    expired.append(cart_id)
+        return expired
+
+
+class LockStripes:
+    """A fixed set of locks shared out by key.
+
+    Two keys only contend when they hash to the same stripe, so buyers of
+    different items don't wait on each other the way they would on one
+    global lock, and the number of locks stays fixed however big the
+    catalog gets.
+    """
+
+    def __init__(self, stripes=LOCK_STRIPES):
+        self.locks = [threading.Lock() for _ in range(stripes)]
+
+    def __call__(self, key):
+        return self.locks[hash(key) % len(self.locks)]
+
+
+class VendingEngine:
+    """Stock and cart logic with no Tk dependency, shared by the GUI and the server.
+
+    The GUI, the socket server and the sweeper all change stock from different
+    threads. Each item's stock is guarded by its stripe in item_locks and each
+    cart by its stripe in cart_locks. A cart lock may be held while taking an
+    item lock, never the other way round, and only one item lock is held at a
+    time, so there is no lock ordering to get wrong.
+    """
+
+    def __init__(self, hold_ttl=CART_HOLD_TTL, stripes=LOCK_STRIPES):
+        self.inventory = {}  # item ID -> item dict
+        self.carts = {LOCAL_CART: {}}  # cart ID -> {item ID -> cart line}
+        self.totals = {LOCAL_CART: 0}  # cart ID -> running total in pence, so it never drifts
+        self.listeners = []  # Called with the list of items whose stock changed, e.g. to save them
+        self.watchers = []  # Also called with changed items, but only to report them, e.g. to clients
+        self.versions = {}  # item ID -> number of stock changes, so subscribers can order updates
+        self.reservations = ReservationLedger(hold_ttl)
+        self.item_locks = LockStripes(stripes)
+        self.cart_locks = LockStripes(stripes)
+        self.sweeper = None
+
+    @property
+    def cart(self):
+        return self.carts[LOCAL_CART]
+
+    def load(self, items):
+        """Replace the inventory in place so existing references stay valid.
+
+        Takes no locks, so only call it before other threads use the engine.
+        Later changes go through merge, update_item and remove_item.
+        """
+        self.inventory.clear()
+        for item in items:
+            self.inventory[item["ID"]] = item
+
+    def merge(self, items):
+        """Add new items and update existing ones in place, e.g. from a catalog import.
+
+        The caller saves the items, since a stock save only writes quantities;
+        watchers are told about every item in one call.
+        """
+        changed = []
+        for item in items:
+            existing = self.inventory.get(item["ID"])
+            if existing is None:
+                self.inventory[item["ID"]] = existing = item
+            else:
+                with self.item_locks(item["ID"]):
+                    existing.update(item)
+            self.versions[item["ID"]] = self.versions.get(item["ID"], 0) + 1
+            changed.append(existing)
+        if changed:
+            self._notify(changed, saved=True)
+
+    def update_item(self, item_id, **fields):
+        """Change an item's details, e.g. its Name or Price, without touching anything else."""
+        item = self.inventory[item_id]
+        with self.item_locks(item_id):
+            item.update(fields)
+        return item
+
+    def remove_item(self, item_id):
+        """Stop selling an item. Carts that hold it keep their lines. Returns the item, or None."""
+        with self.item_locks(item_id):
+            return self.inventory.pop(item_id, None)
+
+    def get_cart(self, cart_id=LOCAL_CART):
+        """Return the cart for cart_id, creating it if needed."""
+        cart = self.carts.get(cart_id)
+        if cart is None:
+            self.totals.setdefault(cart_id, 0)
+            cart = self.carts.setdefault(cart_id, {})
+        return cart
+
+    def _adjust_total(self, cart_id, price, quantity):
+        self.totals[cart_id] += round(price * 100) * quantity
+
+    def _notify(self, items, saved=False):
+        """Tell watchers, and listeners unless the caller has already saved the items, about changed items."""
+        if not saved:
+            for listener in self.listeners:
+                listener(items)
+        for watcher in self.watchers:
+            watcher(items)
+
+    def take_stock(self, item_id, quantity):
+        """Atomically take quantity of an item if at least that much is left. Returns True if taken."""
+        item = self.inventory.get(item_id)
+        if item is None:
+            return False
+        with self.item_locks(item_id):
+            if quantity <= 0 or item["Quantity"] < quantity or self.inventory.get(item_id) is not item:
+                return False  # Not enough left, or the item was removed since it was looked up
+            item["Quantity"] -= quantity
+            self.versions[item_id] = self.versions.get(item_id, 0) + 1
+        return True
+
+    def put_back(self, item_id, quantity):
+        """Return quantity of an item to stock. Returns the item, or None if it is no longer sold."""
+        item = self.inventory.get(item_id)
+        if item is not None:
+            with self.item_locks(item_id):
+                item["Quantity"] += quantity
+                self.versions[item_id] = self.versions.get(item_id, 0) + 1
+        return item
+
+    def add_to_cart(self, item_id, quantity=1, cart_id=LOCAL_CART):
+        """Move stock into a cart. Returns False if there is not enough stock, None if the item is not sold."""
+        item = self.inventory.get(item_id)
+        if item is None:
+            return None
+        with self.cart_locks(cart_id):
+            if not self.take_stock(item_id, quantity):
+                return False
+
+            cart = self.get_cart(cart_id)
+            line = cart.get(item_id)
+            if line is None:
+                line = cart[item_id] = {"ID": item["ID"], "Name": item["Name"], "Price": item["Price"], "Quantity": 0}
+            line["Quantity"] += quantity
+            self._adjust_total(cart_id, line["Price"], quantity)
+            self.reservations.touch(cart_id)
+        self._notify([item])
+        return True
+
+    def remove_from_cart(self, item_id, cart_id=LOCAL_CART):
+        """Remove a line from a cart and return its stock. Returns the removed line, or None if it was not there."""
+        with self.cart_locks(cart_id):
+            cart = self.get_cart(cart_id)
+            line = cart.pop(item_id, None)
+            if line is None:
+                return None  # E.g. the cart expired
+            self._adjust_total(cart_id, line["Price"], -line["Quantity"])
+            if not cart:
+                self.reservations.release(cart_id)
+            item = self.put_back(item_id, line["Quantity"])
+        if item is not None:
+            self._notify([item])
+        return line
+
+    def set_quantity(self, item_id, new_quantity, cart_id=LOCAL_CART):
+        """Change the quantity of a cart line.
+
+        Returns False if there is not enough stock, None if the line is no longer in the cart.
+        """
+        if new_quantity < 0:
+            raise ValueError("Quantity cannot be less than 0.")
+        if new_quantity == 0:
+            return None if self.remove_from_cart(item_id, cart_id) is None else True
+
+        with self.cart_locks(cart_id):
+            line = self.get_cart(cart_id).get(item_id)
+            if line is None:
+                return None
+            difference = new_quantity - line["Quantity"]
+            if difference == 0:
+                return True
+            if difference > 0:
+                item = self.inventory.get(item_id)
+                if not self.take_stock(item_id, difference):
+                    return False
+            else:
+                item = self.put_back(item_id, -difference)
+
+            line["Quantity"] = new_quantity
+            self._adjust_total(cart_id, line["Price"], difference)
+            self.reservations.touch(cart_id)
+        if item is not None:
+            self._notify([item])
+        return True
+
+    def restock(self, item_id, quantity):
+        """Set the stock level of an item."""
+        item = self.inventory[item_id]
+        with self.item_locks(item_id):
+            item["Quantity"] = quantity
+            self.versions[item_id] = self.versions.get(item_id, 0) + 1
+        self._notify([item])
+
+    def restock_many(self, levels):
+        """Set the stock level of many items, saved together. levels maps item ID -> new quantity."""
+        changed = []
+        for item_id, quantity in levels.items():
+            item = self.inventory.get(item_id)
+            if item is None:
+                continue
+            with self.item_locks(item_id):
+                item["Quantity"] = quantity
+                self.versions[item_id] = self.versions.get(item_id, 0) + 1
+            changed.append(item)
+        if changed:
+            self._notify(changed)  # One notification, so the store writes every refill in one transaction
+        return changed
+
+    def _return_to_stock(self, cart_id, expired=False):
+        """Empty a cart back into the inventory and return the items that changed.
+
+        With expired=True the cart was popped by the sweeper, so it is left
+        alone if a cart change renewed its hold in the meantime.
+        """
+        with self.cart_locks(cart_id):
+            if expired and self.reservations.held(cart_id):
+                return []
+            cart = self.get_cart(cart_id)
+            changed = []
+            for item_id, line in cart.items():
+                item = self.put_back(item_id, line["Quantity"])
+                if item is not None:
+                    changed.append(item)
+            cart.clear()
+            self.totals[cart_id] = 0
+            self.reservations.release(cart_id)
+        return changed
+
+    def clear_cart(self, cart_id=LOCAL_CART):
+        """Return everything in a cart to stock."""
+        changed = self._return_to_stock(cart_id)
+        if changed:
+            self._notify(changed)
+
+    def drop_cart(self, cart_id):
+        """Return a cart's stock and forget the cart, e.g. when its client disconnects."""
+        self.clear_cart(cart_id)
+        with self.cart_locks(cart_id):
+            self.carts.pop(cart_id, None)
+            self.totals.pop(cart_id, None)
+
+    def expire_holds(self, now=None, limit=SWEEP_BATCH):
+        """Return the stock of carts whose hold has run out. Returns the expired cart IDs."""
+        expired = self.reservations.due(now, limit)
+        changed = {}
+        for cart_id in expired:
+            for item in self._return_to_stock(cart_id, expired=True):
+                changed[item["ID"]] = item
+        if changed:
+            self._notify(list(changed.values()))  # One save for the whole batch
+        return expired
+
+    def start_sweeper(self, interval=SWEEP_INTERVAL):
+        """Release expired holds from a background thread every interval seconds."""
+        def sweep():
+            while True:
+                time.sleep(interval)
+                while len(self.expire_holds()) == SWEEP_BATCH:
+                    pass  # A full batch means more may be due
+
+        if self.reservations.ttl is not None and self.sweeper is None:
+            self.sweeper = threading.Thread(target=sweep, daemon=True)
+            self.sweeper.start()
+
+    def cart_lines(self, cart_id=LOCAL_CART):
+        """A copy of a cart's lines, item ID -> line, that the sweeper cannot change under the caller."""
+        with self.cart_locks(cart_id):
+            return {item_id: dict(line) for item_id, line in self.get_cart(cart_id).items()}
+
+    def cart_total(self, cart_id=LOCAL_CART):
+        """Total price of a cart, kept up to date as lines change."""
+        self.get_cart(cart_id)
+        return self.totals[cart_id] / 100
+
+    def checkout(self, cart_id=LOCAL_CART):
+        """Empty a cart and return its lines and total. Stock was already taken when items were added."""
+        with self.cart_locks(cart_id):
+            cart = self.get_cart(cart_id)
+            lines = list(cart.values())
+            total = self.cart_total(cart_id)
+            cart.clear()
+            self.totals[cart_id] = 0
+            self.reservations.release(cart_id)
+        return lines, total
+
+    def restore_cart(self, lines, cart_id=LOCAL_CART):
+        """Put checked-out lines back in a cart when the order could not be recorded.
+
+        Their stock was never returned, so only the cart changes.
+        """
+        with self.cart_locks(cart_id):
+            cart = self.get_cart(cart_id)
+            for restored in lines:
+                line = cart.get(restored["ID"])
+                if line is None:
+                    line = cart[restored["ID"]] = dict(restored, Quantity=0)
+                line["Quantity"] += restored["Quantity"]
+                self._adjust_total(cart_id, line["Price"], restored["Quantity"])
+            if lines:
+                self.reservations.touch(cart_id)
+
+
+# Inventory grid layout, in pixels
+INVENTORY_COLUMNS = 5
+TILE_WIDTH = 270
+TILE_HEIGHT = 100
+TILE_GAP = 20
+TILE_PITCH_X = TILE_WIDTH + TILE_GAP
+TILE_PITCH_Y = TILE_HEIGHT + TILE_GAP
+
+WELCOME_IMAGE = "Images/welcome.png"
+
+
+class AssetCache:
+    """Images decoded once and kept alive for the whole process.
+
+    Tk frees a PhotoImage as soon as nothing references it, and pages are
+    rebuilt every time they open, so without this the welcome image would be
+    decoded again on every return to the welcome page.
+    """
+
+    def __init__(self):
+        self.images = {}  # (path, zoom, subsample) -> PhotoImage
+
+    def image(self, path, zoom=1, subsample=1):
+        """Return the image at path, scaled by zoom/subsample, decoding it on first use."""
+        key = (path, zoom, subsample)
+        image = self.images.get(key)
+        if image is None:
+            if zoom == 1 and subsample == 1:
+                image = tk.PhotoImage(file=path)
+            else:
+                # Scale from the cached original rather than decoding the file again
+                image = self.image(path)
+                if zoom != 1:
+                    image = image.zoom(zoom)
+                if subsample != 1:
+                    image = image.subsample(subsample)
+            self.images[key] = image
+        return image
+
+    def preload(self, paths, variants=()):
+        """Decode images, and any (zoom, subsample) variants, ahead of time. Needs the Tk root to exist."""
+        for path in paths:
+            try:
+                self.image(path)
+                for zoom, subsample in variants:
+                    self.image(path, zoom, subsample)
+            except tk.TclError as e:
+                print(f"Warning: could not load {path}: {e}")
+
 
 # Global variables
-inventory = {}
-cart = {}
+assets = AssetCache()
+engine = VendingEngine()
+inventory = engine.inventory
+cart = engine.cart
 user_activity = {}
+async_server = None  # The AsyncVendingServer, when SERVER_MODE is "asyncio"
+
+def server_log(message):
+    if SERVER_VERBOSE:
+        print(message)
 
 def manage_client(conn):
     # Receive the client ID from the client
-    client_id = conn.recv(BUFSIZE).decode('utf-8')
-    print(f"Client {client_id} connected")
+    messages = recv_messages(conn, FrameDecoder(), BUFSIZE)
+    client_id = messages[0][1] if messages else ""
+    server_log(f"Client {client_id} connected")
 
     initial_message = f"Client {client_id} connected to Vending Machine System."
-    conn.sendall(initial_message.encode('utf-8'))
+    conn.sendall(encode_frame(PUSH_ID, initial_message))
 
-    print(f"Is socket closed? {conn._closed}")
+    server_log(f"Is socket closed? {conn._closed}")
 
 
 def handle_command(socket_conn, command):
     """Handle communication with a connected client."""
+    if async_server is not None:
+        async_server.send(command)  # Queued for the server's writer tasks, so the GUI never waits on the network
+        return
     try:
-        socket_conn.sendall(command.encode('utf-8'))
+        socket_conn.sendall(encode_frame(PUSH_ID, command))
     except Exception as e:
-        print(f"Error with command: {e}")
+        server_log(f"Error with command: {e}")
 
 
 def start_server():
@@ -42,11 +507,11 @@ def start_server():
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
         server_socket.bind((HOST, PORT))
         server_socket.listen(10)
-        print(f"Server listening on {HOST}:{PORT}")
+        server_log(f"Server listening on {HOST}:{PORT}")
 
         while True:
             socket_conn, addr = server_socket.accept()
-            print(f"Accepted connection from {addr}")
+            server_log(f"Accepted connection from {addr}")
 
             manage_client(socket_conn)
 
@@ -56,82 +521,675 @@ def start_server():
             client_thread = threading.Thread(target=handle_command, args=(socket_conn, command))
             client_thread.start()
 
+
+def format_stock_update(updates):
+    """Format (item ID, quantity, version) triples as "ID:Quantity:Version" words."""
+    return " ".join(f"{item_id}:{quantity}:{version}" for item_id, quantity, version in updates)
+
+
+class ClientState:
+    """What the asyncio server knows about one connection."""
+
+    def __init__(self, address):
+        self.address = address
+        self.client_id = None
+        self.status = "handshake"  # handshake -> connected -> closed
+        self.connected_at = time.time()
+        self.last_seen = self.connected_at
+        self.bytes_received = 0
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.subscribed = False  # Receives STOCK updates
+        self.cart_id = None  # The client's cart in the engine
+        self.writer = None
+        self.outbox = None  # Bounded queue of encoded replies, drained by writer_task
+        self.pushes = deque()  # Encoded pushed frames; only these are ever dropped
+        self.wakeup = None  # Set when there is something for writer_task to send
+        self.writer_task = None
+
+    def report(self):
+        return {
+            "client_id": self.client_id,
+            "address": self.address,
+            "status": self.status,
+            "subscribed": self.subscribed,
+            "connected_for": round(time.time() - self.connected_at, 3),
+            "idle_for": round(time.time() - self.last_seen, 3),
+            "bytes_received": self.bytes_received,
+            "messages_sent": self.messages_sent,
+            "messages_dropped": self.messages_dropped,
+            "queued": (self.outbox.qsize() if self.outbox is not None else 0) + len(self.pushes),
+        }
+
+
+class AsyncVendingServer:
+    """Serve the HOST/PORT protocol from one asyncio event loop.
+
+    Handshakes never block the accept loop, so a client that connects and
+    stays silent only holds its own connection. Everything sent to a client
+    goes through its own bounded outbound queues, drained by a writer task,
+    so a slow reader never holds up the GUI or other clients. Replies and
+    pushed commands are queued apart: the overflow policy only ever drops
+    pushes, since a client waits for the reply to every request it sends.
+    """
+
+    def __init__(self, host=HOST, port=PORT, handshake_timeout=HANDSHAKE_TIMEOUT, verbose=True,
+                 queue_size=OUTBOUND_QUEUE_SIZE, overflow_policy=OUTBOUND_POLICY):
+        if overflow_policy not in OUTBOUND_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.host = host
+        self.port = port
+        self.handshake_timeout = handshake_timeout
+        self.verbose = verbose
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.connections = {}  # ClientState -> None, in connection order
+        self.clients = {}  # client ID -> ClientState, once the handshake is done
+        self.accepted = 0
+        self.loop = None
+        self.server = None
+        self.ready = threading.Event()
+        self.pending_stock = {}  # item ID -> (quantity, version) waiting to be published
+        self.pending_lock = threading.Lock()
+        self.flush_scheduled = False
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    async def handle_connection(self, reader, writer):
+        state = ClientState(writer.get_extra_info("peername"))
+        state.writer = writer
+        self.connections[state] = None
+        self.accepted += 1
+        decoder = FrameDecoder()
+        try:
+            # Receive the client ID from the client
+            messages = await asyncio.wait_for(self._read_messages(reader, decoder, state), self.handshake_timeout)
+            if not messages:
+                return
+            client_id = messages.pop(0)[1].strip()
+            if client_id in self.clients:
+                client_id = f"{client_id}-{self.accepted}"  # Random IDs can collide
+            state.client_id = client_id
+            state.cart_id = f"client:{client_id}"  # Each client shops from its own cart
+            self.clients[client_id] = state
+            self.log(f"Client {client_id} connected")
+
+            initial_message = f"Client {client_id} connected to Vending Machine System."
+            state.outbox = asyncio.Queue(self.queue_size)
+            state.wakeup = asyncio.Event()
+            state.outbox.put_nowait(encode_frame(PUSH_ID, initial_message))
+            state.wakeup.set()
+            state.writer_task = asyncio.create_task(self._write_loop(state))
+            state.status = "connected"
+
+            # Answer requests until the client goes away. Everything decoded from one
+            # read is answered with one frame batch, so pipelined requests cost one round trip.
+            while messages is not None:
+                if messages:
+                    replies = []
+                    for message_id, command in messages:
+                        reply = self.respond(state, command)
+                        if asyncio.iscoroutine(reply):
+                            reply = await reply  # A cart command running on a worker thread
+                        replies.append((message_id, reply))
+                    # Replies wait for queue space, so a client that stops reading stops being read
+                    await state.outbox.put(encode_frames(replies))
+                    state.wakeup.set()
+                    if any(command.strip().upper() == "EXIT" for _, command in messages):
+                        await self._flush(state)
+                        break
+                messages = await self._read_messages(reader, decoder, state)
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            state.status = "closed"
+            if state.writer_task is not None:
+                state.writer_task.cancel()
+            del self.connections[state]
+            if self.clients.get(state.client_id) is state:
+                del self.clients[state.client_id]
+                self.log(f"Client {state.client_id} disconnected")
+            if state.cart_id is not None:
+                # Put back anything the client left in its cart, off the loop like the other cart commands
+                self.loop.run_in_executor(None, engine.drop_cart, state.cart_id)
+            writer.close()
+
+    def _take_queued(self, state):
+        """Take everything queued for a client, replies first."""
+        batch = []
+        while not state.outbox.empty():
+            batch.append(state.outbox.get_nowait())
+        batch.extend(state.pushes)
+        state.pushes.clear()
+        return batch
+
+    async def _write_loop(self, state):
+        """Send queued frames to one client, batching whatever has piled up into one write."""
+        try:
+            while True:
+                await state.wakeup.wait()
+                state.wakeup.clear()
+                batch = self._take_queued(state)
+                if not batch:
+                    continue
+                state.writer.write(b"".join(batch))
+                state.messages_sent += len(batch)
+                await state.writer.drain()
+        except ConnectionError:
+            state.writer.close()
+
+    async def _flush(self, state):
+        """Stop the writer task and send whatever is still queued."""
+        state.writer_task.cancel()
+        batch = self._take_queued(state)
+        state.writer.write(b"".join(batch))
+        state.messages_sent += len(batch)
+        await state.writer.drain()
+
+    def _enqueue(self, state, data):
+        """Queue a pushed frame for a client without waiting, applying the overflow policy when its queue is full."""
+        if len(state.pushes) < self.queue_size:
+            state.pushes.append(data)
+            state.wakeup.set()
+            return
+        state.messages_dropped += 1
+
+        if self.overflow_policy == "drop_oldest":
+            state.pushes.popleft()  # Replies are never in this queue, so none can be lost
+            state.pushes.append(data)
+        elif self.overflow_policy == "disconnect":
+            self.log(f"Client {state.client_id} is not keeping up, disconnecting")
+            state.writer.close()
+        # "drop_newest" keeps what is already queued
+
+    async def _read_messages(self, reader, decoder, state):
+        """Read until at least one whole message arrives. Returns None when the client disconnects."""
+        while True:
+            data = await reader.read(BUFSIZE)
+            if not data:
+                return None
+            state.bytes_received += len(data)
+            state.last_seen = time.time()
+            messages = decoder.feed(data)
+            if messages:
+                return messages
+
+    def respond(self, state, command):
+        """Answer one request from a client."""
+        command = command.strip().upper()
+        if command == "PING":
+            return "PONG"
+        if command == "VIEW":
+            return get_product_list()
+        if command == "SUBSCRIBE":
+            state.subscribed = True
+            return "SNAPSHOT " + format_stock_update(
+                (item["ID"], item["Quantity"], engine.versions.get(item["ID"], 0)) for item in list(inventory.values())
+            )
+        if command == "UNSUBSCRIBE":
+            state.subscribed = False
+            return "OK UNSUBSCRIBE"
+        words = command.split()
+        if words and words[0] in SHOPPING_COMMANDS:
+            return self.shop_off_loop(state, words)
+        if command in CLIENT_COMMANDS or command.split(" ", 1)[0] in CLIENT_COMMANDS:
+            return f"OK {command}"
+        return "ERROR Unknown command"
+
+    async def committed(self, state, future, lines, total):
+        """Reply to a CHECKOUT once the pipeline has written its batch."""
+        try:
+            transaction_id = await asyncio.wrap_future(future)
+        except (OSError, sqlite3.Error) as error:
+            self.log(f"Checkout failed: {error}")
+            engine.restore_cart(lines, state.cart_id)  # Nothing was sold, so the client can try again
+            return "ERROR Checkout failed, the cart was kept"
+        return f"OK CHECKOUT {transaction_id} {total:.2f}"
+
+    async def shop_off_loop(self, state, words):
+        """Run a cart command on a worker thread.
+
+        Stock changes are saved by the engine's listeners, and a save can wait
+        behind a checkout batch's fsync, so it must not hold up the event loop.
+        """
+        reply = await self.loop.run_in_executor(None, self.shop, state, words)
+        if asyncio.iscoroutine(reply):
+            reply = await reply  # A checkout waiting for its batch to commit
+        return reply
+
+    def shop(self, state, words):
+        """Run a cart command against this client's own cart."""
+        cart_id = state.cart_id
+        try:
+            if words[0] == "ADD":
+                item_id = int(words[1])
+                quantity = int(words[2]) if len(words) > 2 else 1
+                # The engine checks under its locks, so an item removed or a cart expired meanwhile is handled
+                added = engine.add_to_cart(item_id, quantity, cart_id)
+                if added is None:
+                    return f"ERROR Unknown item {item_id}"
+                if not added:
+                    return f"ERROR Not enough stock for item {item_id}"
+                line = engine.get_cart(cart_id).get(item_id)
+                return f"OK ADD {item_id} {line['Quantity'] if line is not None else quantity}"
+
+            if words[0] == "REMOVE":
+                item_id = int(words[1])
+                if engine.remove_from_cart(item_id, cart_id) is None:
+                    return f"ERROR Item {item_id} is not in the cart"
+                return f"OK REMOVE {item_id}"
+
+            if words[0] == "CART":
+                lines = [
+                    f"ID: {line['ID']}, Name: {line['Name']}, Price: £{line['Price']:.2f}, Quantity: {line['Quantity']}"
+                    for line in engine.get_cart(cart_id).values()
+                ]
+                lines.append(f"Total: £{engine.cart_total(cart_id):.2f}")
+                return "\n".join(lines)
+
+            # CHECKOUT
+            if not engine.get_cart(cart_id):
+                return "ERROR Cart is empty"
+            lines, total = engine.checkout(cart_id)
+            if checkout_pipeline is None:
+                try:
+                    transaction_id = store.record_checkout(None, lines, total) if store is not None else str(uuid.uuid4())
+                except (OSError, sqlite3.Error) as error:
+                    self.log(f"Checkout failed: {error}")
+                    engine.restore_cart(lines, cart_id)
+                    return "ERROR Checkout failed, the cart was kept"
+                return f"OK CHECKOUT {transaction_id} {total:.2f}"
+            return self.committed(state, checkout_pipeline.submit(lines, total), lines, total)
+        except (IndexError, ValueError):
+            return f"ERROR Usage: {SHOPPING_COMMANDS[words[0]]}"
+        except KeyError as e:
+            return f"ERROR Item {e} is not available"  # Never let a race close the client's connection
+
+    def _broadcast(self, command, client_id=None):
+        data = encode_frame(PUSH_ID, command)
+        states = self.clients.values() if client_id is None else [self.clients.get(client_id)]
+        for state in states:
+            if state is not None and state.status == "connected":
+                self._enqueue(state, data)
+
+    def send(self, command, client_id=None):
+        """Queue a command for every connected client, or just one. Never blocks; safe to call from any thread."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._broadcast, command, client_id)
+
+    def publish_stock(self, items):
+        """Engine watcher: push the new stock of changed items to subscribed clients.
+
+        Changes are collected until the event loop gets to them, so a burst of
+        changes to one item goes out as a single delta.
+        """
+        with self.pending_lock:
+            for item in items:
+                self.pending_stock[item["ID"]] = (item["Quantity"], engine.versions.get(item["ID"], 0))
+            if self.flush_scheduled or self.loop is None:
+                return
+            self.flush_scheduled = True
+        self.loop.call_soon_threadsafe(self._flush_stock)
+
+    def _flush_stock(self):
+        with self.pending_lock:
+            pending = self.pending_stock
+            self.pending_stock = {}
+            self.flush_scheduled = False
+        data = encode_frame(PUSH_ID, "STOCK " + format_stock_update(
+            (item_id, quantity, version) for item_id, (quantity, version) in pending.items()
+        ))
+        for state in self.clients.values():
+            if state.subscribed and state.status == "connected":
+                self._enqueue(state, data)
+
+    def connection_report(self):
+        """Return the state of every open connection."""
+        return [state.report() for state in list(self.connections)]
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=SERVER_BACKLOG)
+        self.port = self.server.sockets[0].getsockname()[1]  # In case port 0 was asked for
+        print(f"Server listening on {self.host}:{self.port}")
+        self.ready.set()
+        async with self.server:
+            try:
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                pass  # stop() closed the server
+
+    def run(self):
+        """Run the server until the process exits. Call from a background thread."""
+        asyncio.run(self.serve())
+
+    def stop(self):
+        if self.loop is not None and self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+
+def format_inventory_line(item):
+    """Format one item as an inventory file line."""
+    return f"ID: {item['ID']}, Name: {item['Name']}, Price: {item['Price']:.2f}, Quantity: {item['Quantity']}\n"
+
+
+# One line per item: "ID: 1, Name: Some Item, Price: 9.99, Quantity: 5". Names may contain commas.
+INVENTORY_LINE = re.compile(r"^ID: *(\d+), Name: (.*), Price: £?(-?[\d.]+), Quantity: (-?\d+)[ \t\r]*$", re.MULTILINE)
+
+_parse_cache = {}  # filename -> ((mtime_ns, size), parsed items)
+
+
+def parse_inventory_text(text):
+    """Parse inventory file contents into a list of item dictionaries."""
+    return [
+        {"ID": int(item_id), "Name": name, "Price": float(price), "Quantity": int(quantity)}
+        for item_id, name, price, quantity in INVENTORY_LINE.findall(text)
+    ]
+
+
+def load_inventory_file(filename):
+    """Parse an inventory file, reusing the last result while its mtime and size are unchanged.
+
+    Returns copies so callers can change the items without touching the cache.
+    Raises FileNotFoundError if the file does not exist.
+    """
+    stat = os.stat(filename)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _parse_cache.get(filename)
+    if cached is None or cached[0] != key:
+        with open(filename, "r") as file:
+            cached = (key, parse_inventory_text(file.read()))
+        _parse_cache[filename] = cached
+    return [dict(item) for item in cached[1]]
+
+
+class InventoryJournal:
+    """Inventory snapshot plus an append-only journal of changed items.
+
+    Each stock change appends the changed items to the journal, so the cost of a
+    change does not depend on the size of the catalog. When the journal gets long
+    it is folded into a fresh snapshot on a background thread.
+    """
+
+    def __init__(self, get_items, snapshot_file=INVENTORY_FILE, journal_file=JOURNAL_FILE,
+                 compact_threshold=JOURNAL_COMPACT_THRESHOLD):
+        self.get_items = get_items  # Returns the live items to write into a new snapshot
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.old_journal_file = journal_file + ".old"  # Journal being folded in by a compaction
+        self.compact_threshold = compact_threshold
+        self.lock = threading.Lock()
+        self.file = None
+        self.records = 0
+        self.compaction = None
+
+    def replay(self):
+        """Rebuild the inventory from the snapshot followed by the journals."""
+        items = {}
+        with self.lock:
+            for filename in (self.snapshot_file, self.old_journal_file, self.journal_file):
+                try:
+                    for item in load_inventory_file(filename):
+                        items[item["ID"]] = item  # Later records win
+                except FileNotFoundError:
+                    pass
+        return list(items.values())
+
+    def append(self, items):
+        """Append the current state of the changed items to the journal."""
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.journal_file, "a")
+            self.file.write("".join(format_inventory_line(item) for item in items))
+            self.file.flush()
+            self.records += len(items)
+            if self.compaction is not None or self.records < self.compact_threshold:
+                return
+            live_items = self.get_items()
+            if self.records < len(live_items):
+                return  # Wait until the journal is as long as the catalog so compaction cost stays amortised
+            snapshot = [dict(item) for item in live_items]
+            if not os.path.exists(self.old_journal_file):
+                self._rotate()
+            # Otherwise a failed compaction left the old journal behind. Rotating now would
+            # replace it and lose its changes, so retry folding it in and rotate next time.
+            self.compaction = threading.Thread(target=self._compact, args=(snapshot,), daemon=True)
+            self.compaction.start()
+
+    def rewrite(self, items):
+        """Write a full snapshot now and start an empty journal."""
+        compaction = self.compaction
+        if compaction is not None:
+            compaction.join()
+        with self.lock:
+            self._write_snapshot(items)
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            for filename in (self.journal_file, self.old_journal_file):
+                if os.path.exists(filename):
+                    os.remove(filename)
+            self.records = 0
+
+    def _rotate(self):
+        """Move the journal aside so appends carry on into a new file. Caller holds the lock."""
+        self.file.close()
+        os.replace(self.journal_file, self.old_journal_file)
+        self.file = open(self.journal_file, "a")
+        self.records = 0
+
+    def _compact(self, snapshot):
+        """Write the snapshot, then drop the journal it replaces."""
+        try:
+            self._write_snapshot(snapshot)
+            os.remove(self.old_journal_file)
+        finally:
+            self.compaction = None
+
+    def _write_snapshot(self, items):
+        temp_file = self.snapshot_file + ".tmp"
+        with open(temp_file, "w") as file:
+            file.write("".join(format_inventory_line(item) for item in items))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, self.snapshot_file)  # Readers never see a half-written snapshot
+
+
+inventory_journal = InventoryJournal(lambda: inventory.values())
+
+
+class TransactionLog:
+    """The transaction log, split into segments so no file grows without bound.
+
+    Records (see RECORDS.py) are appended to the active file. Once it passes
+    max_bytes or max_age seconds it is sealed: moved into archive_dir, gzipped
+    on a background thread, and listed in archive_dir/index.json with its time
+    range, first and last transaction ID and order count. Queries for a time
+    range only open the segments that overlap it.
+    """
+
+    def __init__(self, filename=TRANSACTION_LOG, archive_dir=TRANSACTION_ARCHIVE,
+                 max_bytes=TRANSACTION_SEGMENT_BYTES, max_age=TRANSACTION_SEGMENT_AGE):
+        self.filename = filename
+        self.archive_dir = archive_dir
+        self.index_file = os.path.join(archive_dir, "index.json")
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.index = None  # Loaded on first use
+        self.active = None  # Time range, IDs and order count of the active file
+        self.file = None
+        self.compressions = []
+
+    def _load(self):
+        """Read the index and work out what the active file holds. Caller holds the lock."""
+        if self.index is not None:
+            return
+        try:
+            with open(self.index_file) as file:
+                self.index = json.load(file)
+        except FileNotFoundError:
+            self.index = {"segments": []}
+
+        # The active file is read back from its records, which is cheap because it never
+        # grows past max_bytes; only the first and last bodies are decoded
+        if os.path.exists(self.filename):
+            first = last = None
+            orders = whole = 0
+            with RecordReader(self.filename) as reader:
+                for created_at, body in reader.scan():
+                    if first is None:
+                        first = (created_at, json.loads(bytes(body))["id"])
+                    last = (created_at, body.tobytes())
+                    orders += 1
+                    whole += RECORD_HEADER.size + len(body)
+            if os.path.getsize(self.filename) > whole:
+                # Drop a record cut short by a crash, or new records would land after it and be lost
+                with open(self.filename, "r+b") as file:
+                    file.truncate(whole)
+            if first is not None:
+                self.active = {
+                    "start": first[0],
+                    "end": last[0],
+                    "first_id": first[1],
+                    "last_id": json.loads(last[1])["id"],
+                    "orders": orders,
+                }
+
+    def _save_index(self):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        temp_file = self.index_file + ".tmp"
+        with open(temp_file, "w") as file:
+            json.dump(self.index, file, indent=1)
+        os.replace(temp_file, self.index_file)
+
+    def append(self, records):
+        """Append (transaction ID, time, encoded record) triples with one write and one fsync."""
+        if not records:
+            return
+        with self.lock:
+            self._load()
+            if self.file is None:
+                self.file = open(self.filename, "ab")
+            self.file.write(b"".join(data for _, _, data in records))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+            if self.active is None:
+                self.active = {"start": records[0][1], "first_id": records[0][0], "orders": 0}
+            self.active["end"] = records[-1][1]
+            self.active["last_id"] = records[-1][0]
+            self.active["orders"] += len(records)
+            if records[-1][1] - self.active["start"] >= self.max_age or self.file.tell() >= self.max_bytes:
+                self._seal()
+
+    def _seal(self):
+        """Move the active file into the archive and start compressing it. Caller holds the lock."""
+        self.file.close()
+        self.file = None
+        os.makedirs(self.archive_dir, exist_ok=True)
+        number = len(self.index["segments"]) + 1
+        name = f"segment-{number:06d}.log"
+        os.replace(self.filename, os.path.join(self.archive_dir, name))
+
+        segment = dict(self.active, file=name)
+        self.index["segments"].append(segment)
+        self.active = None
+        self._save_index()
+
+        compression = threading.Thread(target=self._compress, args=(segment,), daemon=True)
+        self.compressions.append(compression)
+        compression.start()
+
+    def _compress(self, segment):
+        """Gzip a sealed segment, then point the index at the compressed copy."""
+        path = os.path.join(self.archive_dir, segment["file"])
+        with open(path, "rb") as source, gzip.open(path + ".gz.tmp", "wb") as target:
+            shutil.copyfileobj(source, target)
+        os.replace(path + ".gz.tmp", path + ".gz")
+        with self.lock:
+            segment["file"] += ".gz"
+            self._save_index()
+        os.remove(path)  # Only once the index no longer points at it
+
+    def wait(self):
+        """Wait for background compressions to finish."""
+        for compression in self.compressions:
+            compression.join()
+        self.compressions = []
+
+    def segments(self, start=None, end=None):
+        """Segments that may hold orders between start and end (seconds since the epoch), oldest first.
+
+        The active file is included as a segment whose "file" is None.
+        """
+        with self.lock:
+            self._load()
+            found = [dict(segment) for segment in self.index["segments"]]
+            if self.active is not None:
+                found.append(dict(self.active, file=None))
+        return [segment for segment in found
+                if (end is None or segment["start"] <= end) and (start is None or segment["end"] >= start)]
+
+    def records(self, start=None, end=None):
+        """Yield every order between start and end as a dict, oldest first."""
+        for segment in self.segments(start, end):
+            if segment["file"] is None:
+                path = self.filename
+            else:
+                path = os.path.join(self.archive_dir, segment["file"])
+            try:
+                reader = RecordReader(path)
+            except FileNotFoundError:
+                if segment["file"] is None or path.endswith(".gz"):
+                    continue  # Sealed since the index was read
+                reader = RecordReader(path + ".gz")  # Compressed since the index was read
+            with reader:
+                yield from reader.records(start, end)
+
+
+transaction_log = TransactionLog()
+
+
+def read_inventory_items():
+    """Read the saved inventory from the database, or the text file and any journalled changes."""
+    if STORAGE_BACKEND == "sqlite" and store is not None:
+        return store.load_products()
+    if INVENTORY_JOURNAL:
+        return inventory_journal.replay()
+    return load_inventory_file(INVENTORY_FILE)
+
+
 class Product:
     def load_inventory(self):
         """Load inventory from file into a dictionary."""
-        global inventory #calls global variable inventory
-        inventory = {} #declares inventory as a dictionary
+        items = [] #collects the parsed items
         try: #opens iteration
-            with open(INVENTORY_FILE, "r") as file: #reads from variable INVENTORY_FILE
-                lines = file.readlines() #stores each line in the file to lines
-                if not lines: #compares
-                    print("Warning: Inventory file is empty. Starting with an empty inventory.")
-                for line in lines:
-                    parts = line.split(", ")
-                    item = {}
-                    for part in parts:
-                        key, value = part.split(": ")
-                        key = key.strip()
-                        value = value.strip()
-                        if key in ["ID", "Quantity"]:
-                            value = int(value)
-                        elif key == "Price":
-                            value = float(value)
-                        item[key] = value
-                    inventory[item["ID"]] = item
+            items = read_inventory_items() #reads the snapshot and any journalled changes
+            if not items: #compares
+                print("Warning: Inventory file is empty. Starting with an empty inventory.")
         except FileNotFoundError:
             print(f"Error: {INVENTORY_FILE} not found. Starting with empty inventory.")
+        engine.load(items)
 
 
     def save_inventory(self):
         """Save updated inventory back to file."""
-        with open(INVENTORY_FILE, "w") as file:
-            for item in inventory.values():
-                file.write(
-                    f"ID: {item['ID']}, Name: {item['Name']}, Price: {item['Price']}, Quantity: {item['Quantity']}\n"
-                )
+        update_inventory_file()
 
 
     # Modify save_transaction to save transactions in the database
     def save_transaction(self, cart, total_cost, db_conn, cursor):
-        # Generate a unique transaction ID
         """Save completed transactions ensuring unique transaction IDs."""
-        # Step 1: Load existing transaction IDs from the transactions file
-        existing_ids = set()
-        try:
-            with open(TRANSACTION_FILE, "r") as file:
-                lines = file.readlines()
-                for line in lines:
-                    if line.startswith("Transaction ID:"):
-                        # Extract the ID and add it to the set
-                        transaction_id = int(line.split(":")[1].strip())
-                        existing_ids.add(transaction_id)
-        except FileNotFoundError:
-            print(f"Note: {TRANSACTION_FILE} not found. It will be created.")
-
-        # Step 2: Generate a unique transaction ID
-        while True:
-            transaction_id = str(uuid.uuid4())
-            if transaction_id not in existing_ids:
-                break
-        # Also save to the transactions.txt file for logging
-        with open(TRANSACTION_FILE, "a") as file:
-            file.write("\nOrder Receipt:\n")
-            for item in cart.values():
-                file.write(
-                    f"ID: {item['ID']}, Name: {item['Name']}, "
-                    f"Price: {item['Price']}, Quantity: {item['Quantity']}\n"
-                )
-            file.write(f"Transaction ID: {transaction_id}\n")
-            file.write(f"Total cost: £{total_cost:.2f}\n")
-
-        for item in cart.values():
-            cursor.execute('''
-                    INSERT INTO transactions (transaction_id, product_id, name, price, quantity)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (transaction_id, item['ID'], item['Name'], item['Price'], item['Quantity']))
-
-            db_conn.commit()  # Commit the transaction to the database
+        # The store checks uniqueness against the orders table's primary key, so
+        # the cost does not grow with the number of past transactions
+        transaction_id = store.record_checkout(None, list(cart.values()), total_cost)
+
+        # Also save to the transaction log
+        created_at = time.time()
+        transaction_log.append([(transaction_id, created_at,
+                                 encode_record(transaction_id, created_at, total_cost, cart.values()))])
         return transaction_id
 
 def inv_socket(socket_conn):
@@ -149,10 +1207,7 @@ def open_welcome_page(conn):
 
     def restore_inventory_on_exit():
         """Restore inventory if cart is not empty and the window is closed."""
-        for item_id, item in cart.items():
-            inventory[item_id]["Quantity"] += item["Quantity"]
-        cart.clear()  # Clear the cart
-        update_inventory_file()  # Save the restored inventory to the file
+        engine.clear_cart()  # Return the cart to stock, which saves the inventory
         root.destroy()  # Close the application
 
     def open_view_page():
@@ -192,7 +1247,7 @@ def open_welcome_page(conn):
     ).pack(pady=20)
 
     # Welcome Image
-    welcome_image = tk.PhotoImage(file="Images/welcome.png")  # Ensure you have this image
+    welcome_image = assets.image(WELCOME_IMAGE)  # Decoded once, then reused
     tk.Label(welcome_frame, image=welcome_image, bg="#f0f0f0").pack(pady=10)
 
     # Buttons
@@ -241,6 +1296,63 @@ def open_welcome_page(conn):
     welcome_frame.image = welcome_image
 
 
+def plan_restock(items, par_levels, low_water=RESTOCK_LOW_WATER):
+    """List the items that need refilling to their par level from fresh_inventory.txt.
+
+    An item is due when its stock is at or below low_water times its par
+    level, so 0 only refills sold-out items and 1 tops up anything below par.
+    Items without a par level are left alone. One pass over the catalog.
+    """
+    plan = []
+    for item in items:
+        par = par_levels.get(item["ID"])
+        if par is not None and item["Quantity"] < par and item["Quantity"] <= par * low_water:
+            plan.append({"ID": item["ID"], "Name": item["Name"], "Quantity": item["Quantity"], "Par": par,
+                         "Refill": par - item["Quantity"]})
+    return plan
+
+
+def apply_restock(plan):
+    """Refill every item in a restock plan with one save."""
+    return engine.restock_many({line["ID"]: line["Par"] for line in plan})
+
+
+def import_catalog_file(path):
+    """Stream a CSV or JSON lines catalog into the inventory, saving each batch as it goes.
+
+    Imported quantities also become the items' fresh_inventory.txt par levels,
+    which is written once at the end. Returns the CATALOG.import_catalog report.
+    """
+    try:
+        par_levels = {item["ID"]: item["Quantity"] for item in load_inventory_file(FRESH_INVENTORY_FILE)}
+    except FileNotFoundError:
+        par_levels = {}
+
+    def save_batch(items):
+        engine.merge(items)  # Subscribed clients get one STOCK delta per batch; the save is done here
+        for item in items:
+            par_levels[item["ID"]] = item["Quantity"]
+        if STORAGE_BACKEND == "sqlite" and store is not None:
+            store.upsert_products(items)  # One commit per batch
+        elif INVENTORY_JOURNAL:
+            inventory_journal.append(items)
+
+    report = catalog.import_catalog(path, save_batch, max(inventory, default=0) + 1)
+    if STORAGE_BACKEND != "sqlite" and not INVENTORY_JOURNAL:
+        update_inventory_file()  # The plain text file can only be rewritten whole
+    with open(FRESH_INVENTORY_FILE, "w") as fresh_file:
+        for item in inventory.values():
+            fresh_file.write(format_inventory_line(dict(item, Quantity=par_levels.get(item["ID"], item["Quantity"]))))
+    return report
+
+
+def export_catalog_file(path):
+    """Stream the catalog to a CSV or JSON lines file. Returns the CATALOG.export_catalog report."""
+    if STORAGE_BACKEND == "sqlite" and store is not None:
+        return catalog.export_catalog(path, store.iter_products())
+    return catalog.export_catalog(path, list(inventory.values()))
+
+
 def open_admin(conn):
     def admin_login_page():
         """Open the Admin Login page."""
@@ -291,17 +1403,11 @@ def open_admin(conn):
     tk.Button(admin_frame, text="Exit", command=go_back, font=("Arial", 12), bg="#FF4C4C", fg="white", width=20).pack(pady=10)
 
     def save_inventory(items):
-        """Save inventory items to the files."""
-        with open("inventory.txt", "w") as inventory_file:
-            for item in items:
-                inventory_file.write(
-                    f"ID: {item['ID']}, Name: {item['Name']}, Price: {item['Price']:.2f}, Quantity: {item['Quantity']}\n"
-                )
-        with open("fresh_inventory.txt", "w") as fresh_file:
-            for item in items:
-                fresh_file.write(
-                    f"ID: {item['ID']}, Name: {item['Name']}, Price: {item['Price']:.2f}, Quantity: {item['Quantity']}\n"
-                )
+        """Save inventory items to the files. Changes are made through the engine first."""
+        items = list(items)
+        update_inventory_file()
+        with open(FRESH_INVENTORY_FILE, "w") as fresh_file:
+            fresh_file.write("".join(format_inventory_line(item) for item in items))
 
     def inventory_manager_page():
         """Display the Inventory Manager page for handling out-of-stock items."""
@@ -310,24 +1416,10 @@ def open_admin(conn):
 
         tk.Label(inventory_frame, text="Inventory Manager", font=("Arial", 20), bg="#f0f0f0").pack(pady=10)
 
-        inventory_items = []
-        with open("inventory.txt", "r") as inventory_file:
-            for line in inventory_file:
-                parts = line.strip().split(", ")
-                item = {
-                    "ID": parts[0].split(": ")[1],
-                    "Name": parts[1].split(": ")[1],
-                    "Price": float(parts[2].split(": ")[1]),
-                    "Quantity": int(parts[3].split(": ")[1]),
-                }
-                inventory_items.append(item)
+        inventory_items = list(inventory.values())  # The engine holds the current stock
 
         # Load fresh inventory for refilling
-        with open("fresh_inventory.txt", "r") as fresh_file:
-            fresh_items = {
-                line.split(", ")[0].split(": ")[1]: int(line.split(", ")[3].split(": ")[1])
-                for line in fresh_file
-            }
+        fresh_items = {item["ID"]: item["Quantity"] for item in load_inventory_file(FRESH_INVENTORY_FILE)}
 
         def add_new_item():
 
@@ -361,9 +1453,10 @@ def open_admin(conn):
                     new_name = name_entry.get()
                     new_price = float(price_entry.get())
                     new_quantity = int(quantity_entry.get())
-                    new_id = str(int(inventory_items[-1]["ID"]) + 1 if inventory_items else 1)
+                    new_id = max((int(item["ID"]) for item in inventory_items), default=0) + 1  # Engine keys are ints
 
                     new_item = {"ID": new_id, "Name": new_name, "Price": new_price, "Quantity": new_quantity}
+                    engine.merge([new_item])
                     inventory_items.append(new_item)
                     save_inventory(inventory_items)
 
@@ -425,6 +1518,7 @@ def open_admin(conn):
                 if result:
                     nonlocal inventory_items
                     inventory_items = [item for item in inventory_items if item["ID"] != item_id]
+                    engine.remove_item(item_id)
                     save_inventory(inventory_items)
                     messagebox.showinfo("Success", "Item removed successfully!")
                     remove_item()
@@ -526,9 +1620,8 @@ def open_admin(conn):
 
                 def save_edit():
                     """Save changes to the item."""
-                    item["Name"] = name_entry.get()
                     try:
-                        item["Price"] = float(price_entry.get())
+                        engine.update_item(item["ID"], Name=name_entry.get(), Price=float(price_entry.get()))
                         save_inventory(inventory.values())  # Save updated inventory to file
                         messagebox.showinfo("Success", "Item edited successfully!")
                         edit_item_page()  # Navigate back to the edit item grid
@@ -591,21 +1684,13 @@ def open_admin(conn):
 
         def refill_item(item_id):
             """Refill stock for a selected item."""
-            for item in inventory_items:
-                if item["ID"] == item_id and item["ID"] in fresh_items:
-                    if item["Quantity"] == 0:
-                        item["Quantity"] = fresh_items[item_id]
-                        messagebox.showinfo("Success", f"{item['Name']} stock has been refilled!")
-                    else:
-                        messagebox.showwarning("Warning", f"{item['Name']} is not out of stock.")
-                    break
-
-            # Save updated inventory to file
-            with open("inventory.txt", "w") as inventory_file:
-                for item in inventory_items:
-                    inventory_file.write(
-                        f"ID: {item['ID']}, Name: {item['Name']}, Price: {item['Price']:.2f}, Quantity: {item['Quantity']}\n"
-                    )
+            item = inventory.get(item_id)
+            if item is not None and item_id in fresh_items:
+                if item["Quantity"] == 0:
+                    engine.restock(item_id, fresh_items[item_id])  # Saves only this item
+                    messagebox.showinfo("Success", f"{item['Name']} stock has been refilled!")
+                else:
+                    messagebox.showwarning("Warning", f"{item['Name']} is not out of stock.")
 
             # Refresh the inventory manager page
             inventory_frame.pack_forget()
@@ -637,6 +1722,34 @@ def open_admin(conn):
                         width=12,
                     ).pack(side="right", padx=10)
 
+        def restock_all():
+            """Refill every item that has fallen to the low-water mark, in one save."""
+            try:
+                low_water = float(low_water_entry.get()) / 100
+            except ValueError:
+                messagebox.showerror("Error", "Low-water mark must be a percentage.")
+                return
+            plan = plan_restock(inventory.values(), fresh_items, low_water)
+            if not plan:
+                messagebox.showinfo("Restock", "Nothing is at or below the low-water mark.")
+                return
+            units = sum(line["Refill"] for line in plan)
+            if messagebox.askyesno("Restock", f"Refill {len(plan)} items with {units} units in total?"):
+                apply_restock(plan)
+                messagebox.showinfo("Success", f"{len(plan)} items have been refilled!")
+                inventory_frame.pack_forget()
+                inventory_manager_page()
+
+        restock_frame = tk.Frame(inventory_frame, bg="#f0f0f0")
+        restock_frame.pack(pady=10)
+        tk.Label(restock_frame, text="Low-water mark (%):", bg="#f0f0f0", font=("Arial", 12)).pack(side="left")
+        low_water_entry = tk.Entry(restock_frame, width=5, font=("Arial", 12))
+        low_water_entry.insert(0, f"{RESTOCK_LOW_WATER * 100:g}")
+        low_water_entry.pack(side="left", padx=5)
+        tk.Button(
+            restock_frame, text="Restock All", command=restock_all, font=("Arial", 12), bg="#4CAF50", fg="white", width=10
+        ).pack(side="left", padx=5)
+
         tk.Button(
             inventory_frame, text="Add New Item", command=lambda: [add_new_item()], font=("Arial", 12), bg="#4CAF50", fg="white", width=10
         ).pack(pady=20)
@@ -649,11 +1762,111 @@ def open_admin(conn):
             inventory_frame, text="Edit Item", command=lambda: [edit_item_page()], font=("Arial", 12), bg="#00CCFF", fg="white", width=10
         ).pack(pady=20)
 
+        def import_catalog():
+            """Import products in bulk from a CSV or JSON lines file."""
+            path = filedialog.askopenfilename(
+                title="Import Catalog", filetypes=[("Catalog files", "*.csv *.jsonl *.ndjson"), ("All files", "*.*")])
+            if not path:
+                return
+            report = import_catalog_file(path)
+            message = (f"Imported {report['imported']} of {report['rows']} rows in {report['seconds']:.1f}s "
+                       f"({report['rows_per_s']:.0f} rows/s).")
+            if report["rejected"]:
+                message += f"\n\n{report['rejected']} rows were rejected (all listed in {report['rejected_file']}):\n"
+                message += "\n".join(f"Line {number}: {reason}" for number, reason in report["rejected_rows"][:10])
+                messagebox.showwarning("Import", message)
+            else:
+                messagebox.showinfo("Import", message)
+            inventory_frame.pack_forget()
+            inventory_manager_page()
+
+        def export_catalog():
+            """Export every product to a CSV or JSON lines file."""
+            path = filedialog.asksaveasfilename(
+                title="Export Catalog", defaultextension=".csv",
+                filetypes=[("CSV", "*.csv"), ("JSON lines", "*.jsonl")])
+            if not path:
+                return
+            report = export_catalog_file(path)
+            messagebox.showinfo(
+                "Export", f"Exported {report['rows']} rows in {report['seconds']:.1f}s ({report['rows_per_s']:.0f} rows/s).")
+
+        catalog_frame = tk.Frame(inventory_frame, bg="#f0f0f0")
+        catalog_frame.pack(pady=10)
+        tk.Button(
+            catalog_frame, text="Import Catalog", command=import_catalog, font=("Arial", 12), bg="#4CAF50", fg="white", width=12
+        ).pack(side="left", padx=5)
+        tk.Button(
+            catalog_frame, text="Export Catalog", command=export_catalog, font=("Arial", 12), bg="#00CCFF", fg="white", width=12
+        ).pack(side="left", padx=5)
+
+        tk.Button(
+            inventory_frame, text="Sales Report", command=lambda: [inventory_frame.pack_forget(), sales_report_page()],
+            font=("Arial", 12), bg="#00CCFF", fg="white", width=10
+        ).pack(pady=20)
+
         # Logout button
         tk.Button(
             inventory_frame, text="Logout", command=lambda: [inventory_frame.pack_forget(), open_welcome_page(conn)], font=("Arial", 12), bg="#FF4C4C", fg="white", width=10
         ).pack(pady=20)
 
+    def sales_report_page():
+        """Show revenue, best selling products and sales by hour of day."""
+        report_frame = tk.Frame(root, bg="#f0f0f0")
+        report_frame.pack(fill=tk.BOTH, expand=True)
+
+        tk.Label(report_frame, text="Sales Report", font=("Arial", 20), bg="#f0f0f0").pack(pady=10)
+
+        try:
+            report_conn = analytics.connect(DATABASE_FILE)  # Read-only, so checkouts carry on meanwhile
+            try:
+                report = analytics.sales_report(report_conn)
+            finally:
+                report_conn.close()
+        except sqlite3.Error:
+            report = analytics.sales_report_from_records(transaction_log.records())
+
+        tk.Label(
+            report_frame,
+            text=f"Orders: {report['orders']} | Units sold: {report['units']} | Revenue: £{report['revenue']:.2f}",
+            font=("Arial", 14),
+            bg="#f0f0f0",
+        ).pack(pady=5)
+
+        columns = tk.Frame(report_frame, bg="#f0f0f0")
+        columns.pack(fill=tk.BOTH, expand=True, padx=10)
+
+        products_frame = tk.Frame(columns, bg="#ffffff", relief="groove", bd=2)
+        products_frame.pack(side="left", fill=tk.BOTH, expand=True, padx=5)
+        tk.Label(products_frame, text="Best Sellers", font=("Arial", 14), bg="#ffffff").pack(pady=5)
+        for product in report["products"][:10]:
+            tk.Label(
+                products_frame,
+                text=f"{product['Name']}: {product['Units']} sold, £{product['Revenue']:.2f}",
+                font=("Arial", 11),
+                bg="#ffffff",
+                anchor="w",
+            ).pack(fill=tk.X, padx=10)
+
+        hours_frame = tk.Frame(columns, bg="#ffffff", relief="groove", bd=2)
+        hours_frame.pack(side="left", fill=tk.BOTH, expand=True, padx=5)
+        tk.Label(hours_frame, text="Sales by Hour", font=("Arial", 14), bg="#ffffff").pack(pady=5)
+        busiest = max(hour["Revenue"] for hour in report["hours"]) or 1
+        for number, hour in enumerate(report["hours"]):
+            bar = "█" * round(20 * hour["Revenue"] / busiest)
+            tk.Label(
+                hours_frame,
+                text=f"{number:02d}:00 {bar} £{hour['Revenue']:.2f}",
+                font=("Courier", 10),
+                bg="#ffffff",
+                anchor="w",
+            ).pack(fill=tk.X, padx=10)
+
+        tk.Button(
+            report_frame, text="Back", command=lambda: [report_frame.pack_forget(), inventory_manager_page()],
+            font=("Arial", 12), bg="#FF4C4C", fg="white", width=10
+        ).pack(pady=10)
+
 def inventory_page(conn):
     """Display the inventory with Add to Cart buttons."""
 
@@ -679,67 +1892,42 @@ def inventory_page(conn):
         cart.cart_page(conn)
         cart_socket(conn)
 
-    def load_inventory_from_file():
-        """Load the inventory from the inventory.txt file."""
-        global inventory
-        inventory = {}  # Initialize the inventory dictionary
-
-        try:
-            with open("inventory.txt", "r") as inventory_file:
-                for line in inventory_file:
-                    # Each line should be in the format: ID: {ID}, Name: {Name}, Price: {Price}, Quantity: {Quantity}
-                    parts = line.strip().split(", ")
-                    item_id = int(parts[0].split(": ")[1])
-                    name = parts[1].split(": ")[1]
-                    price = float(parts[2].split(": ")[1].replace("£", ""))  # Remove currency symbol if present
-                    quantity = int(parts[3].split(": ")[1])
-
-                    # Add item to the global inventory dictionary
-                    inventory[item_id] = {
-                        "ID": item_id,
-                        "Name": name,
-                        "Price": price,
-                        "Quantity": quantity,
-                    }
-        except FileNotFoundError:
-            messagebox.showerror("Error", "Inventory file not found!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error loading inventory: {e}")
-
     def create_inventory_grid():
-        """Create a grid of inventory items with hover functionality."""
+        """Create a grid of inventory items with hover functionality.
+
+        Only the tiles that fit on screen exist. Scrolling moves them and gives
+        them new items, and adding to cart updates just the tile that was clicked.
+        """
         # Clear the existing grid widgets before repopulating
         for widget in inventory_frame.winfo_children():
             widget.destroy()
 
-        def on_enter(event, item):
+        item_ids = list(inventory)  # Grid position -> item ID
+        tiles = []  # Reused labels, each with the canvas window that holds it
+        tile_for_item = {}  # item ID -> label currently showing it
+
+        def on_enter(event):
             """Change display when mouse enters a box."""
             label = event.widget  # Get the widget triggering the event
-            label.config(text=f"£{item['Price']} | {item['Quantity']} left", bg="#dff0d8")
+            item = inventory.get(label.item_id)
+            if item is not None:
+                label.config(text=f"£{item['Price']} | {item['Quantity']} left", bg="#dff0d8")
+                label.hovered = True
 
-        def on_leave(event, item):
+        def on_leave(event):
             """Revert display when mouse leaves a box."""
             label = event.widget
-            label.config(text=item["Name"], bg="#f0f0f0")
+            label.hovered = False
+            item = inventory.get(label.item_id)
+            if item is not None:
+                label.config(text=item["Name"], bg="#f0f0f0")
 
         def on_click(item_id):
             """Handle click on a box."""
             if item_id in inventory:
                 item = inventory[item_id]
-                if item["Quantity"] > 0:
-                    # Add to cart or update cart quantity
-                    if item_id in cart:
-                        cart[item_id]["Quantity"] += 1
-                    else:
-                        cart[item_id] = {
-                            "ID": item["ID"],
-                            "Name": item["Name"],
-                            "Price": item["Price"],
-                            "Quantity": 1,
-                        }
-                    inventory[item_id]["Quantity"] -= 1
-                    update_inventory_file()  # Update the inventory.txt file
-                    update_inventory_page()  # Refresh the inventory page with the updated data
+                if engine.add_to_cart(item_id):
+                    update_inventory_page(item_id)  # Refresh the tile with the updated data
                     messagebox.showinfo("Success", f"{item['Name']} added to cart!")
 
                     add_socket(conn)
@@ -748,58 +1936,80 @@ def inventory_page(conn):
             else:
                 messagebox.showerror("Error", "Item not found in inventory!")
 
-        def update_inventory_file():
-            """Write the updated inventory back to the inventory.txt file."""
-            with open("inventory.txt", "w") as file:
-                for item in inventory.values():
-                    file.write(
-                        f"ID: {item['ID']}, Name: {item['Name']}, Price: {item['Price']:.2f}, Quantity: {item['Quantity']}\n"
-                    )
+        def update_inventory_page(item_id):
+            """Refresh the one tile showing item_id, if it is on screen."""
+            label = tile_for_item.get(item_id)
+            if label is not None and item_id in inventory:
+                item = inventory[item_id]
+                if label.hovered:
+                    label.config(text=f"£{item['Price']} | {item['Quantity']} left")
+                else:
+                    label.config(text=item["Name"])
 
-        def update_inventory_page():
-            """Refresh the inventory display with the most up-to-date information."""
-            create_inventory_grid()  # Re-create the grid from scratch
+        def make_tile():
+            label = tk.Label(
+                canvas,
+                font=("Arial", 13),
+                bg="#f0f0f0",
+                relief="raised",
+                bd=2,
+            )
+            label.item_id = None
+            label.hovered = False
+
+            # Bind hover and click events once; they look up whichever item the tile shows
+            label.bind("<Enter>", on_enter)
+            label.bind("<Leave>", on_leave)
+            label.bind("<Button-1>", lambda e: on_click(e.widget.item_id))
+
+            window = canvas.create_window(0, 0, window=label, anchor="nw", width=TILE_WIDTH, height=TILE_HEIGHT)
+            tiles.append((label, window))
+
+        def layout_tiles(*args):
+            """Give the pooled tiles the items in the rows currently on screen."""
+            visible_rows = canvas.winfo_height() // TILE_PITCH_Y + 2
+            while len(tiles) < visible_rows * INVENTORY_COLUMNS:
+                make_tile()
+
+            first_row = int(canvas.canvasy(0)) // TILE_PITCH_Y
+            first_index = first_row * INVENTORY_COLUMNS
+            tile_for_item.clear()
+            for offset, (label, window) in enumerate(tiles):
+                index = first_index + offset
+                if index >= len(item_ids):
+                    canvas.itemconfigure(window, state="hidden")
+                    label.item_id = None
+                    continue
+
+                row, col = divmod(index, INVENTORY_COLUMNS)
+                canvas.coords(window, TILE_GAP + col * TILE_PITCH_X, TILE_GAP + row * TILE_PITCH_Y)
+                canvas.itemconfigure(window, state="normal")
+                item_id = item_ids[index]
+                tile_for_item[item_id] = label
+                if label.item_id != item_id:
+                    label.item_id = item_id
+                    label.hovered = False
+                    label.config(text=inventory[item_id]["Name"], bg="#f0f0f0")
+
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            layout_tiles()
 
         # Header
         tk.Label(inventory_frame, text="Inventory", font=("Arial", 25)).pack(pady=10)
 
-        # Create a scrollable frame for the inventory grid
+        # Create a scrollable canvas for the inventory grid
         canvas = tk.Canvas(inventory_frame)
-        scrollable_frame = tk.Frame(canvas)
         scrollbar = ttk.Scrollbar(inventory_frame, orient="vertical", command=canvas.yview)
-        canvas.configure(yscrollcommand=scrollbar.set)
+        canvas.configure(yscrollcommand=on_scroll)
 
         scrollbar.pack(side="right", fill="y")
         canvas.pack(side="left", fill="both", expand=True)
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
 
-        # Create the grid
-        row, col = 0, 0
-        for item_id, item in inventory.items():
-            label = tk.Label(
-                scrollable_frame,
-                text=item["Name"],
-                font=("Arial", 13),
-                bg="#f0f0f0",
-                width=27,
-                height=5,
-                relief="raised",
-                bd=2,
-            )
-            label.grid(row=row, column=col, padx=20, pady=20)
-
-            # Bind hover and click events
-            label.bind("<Enter>", lambda e, i=item: on_enter(e, i))
-            label.bind("<Leave>", lambda e, i=item: on_leave(e, i))
-            label.bind("<Button-1>", lambda e, i=item_id: on_click(i))
-
-            col += 1
-            if col > 4:  # Adjust for desired grid width (e.g., 3 items per row)
-                col = 0
-                row += 1
-
-        scrollable_frame.update_idletasks()
-        canvas.config(scrollregion=canvas.bbox("all"))
+        # The scroll region covers every row even though only the visible ones have tiles
+        rows = -(-len(item_ids) // INVENTORY_COLUMNS)
+        canvas.config(scrollregion=(0, 0, TILE_GAP + INVENTORY_COLUMNS * TILE_PITCH_X, TILE_GAP + rows * TILE_PITCH_Y))
+        canvas.bind("<Configure>", layout_tiles)
 
         # Back and Cart buttons
         tk.Button(inventory_frame, text="Back", command=go_back, width=7, height=5, relief="solid", bd=2, font=("Arial", 11), bg="#FF4C4C").pack(pady=5)
@@ -809,8 +2019,6 @@ def inventory_page(conn):
     inventory_frame = tk.Frame(root)
     inventory_frame.pack(fill=tk.BOTH, expand=True)
 
-    load_inventory_from_file()
-
     create_inventory_grid()  # Initially create the inventory grid
 
 def remove_socket(conn):
@@ -850,106 +2058,144 @@ class Cart:
 
         def clear_cart():
             """Clear the cart and update the cart summary dynamically."""
-            for item_id in cart:
-                inventory[item_id]["Quantity"] += cart[item_id]["Quantity"]  # Return all quantities to inventory
-            cart.clear()
-            update_inventory_file()
+            engine.clear_cart()  # Return all quantities to inventory
             messagebox.showinfo("Cart", "Cart has been cleared")
+            close_edit_row()
             refresh_cart_summary()
 
         def remove_item(item_id):
             """Remove an item from the cart entirely."""
-            current_cart_quantity = cart[item_id]["Quantity"]
-            item_name = cart[item_id]["Name"]
-
-            inventory[item_id]["Quantity"] += current_cart_quantity
-            del cart[item_id]
-            update_inventory_file()
+            if item_id not in cart:
+                messagebox.showinfo("Cart", "Your cart expired and its items went back on sale.")
+                close_edit_row()
+                refresh_cart_summary()
+                return
+            line = engine.remove_from_cart(item_id)
+            if line is None:  # Expired after the check above
+                messagebox.showinfo("Cart", "Your cart expired and its items went back on sale.")
+                close_edit_row()
+                refresh_cart_summary()
+                return
+            item_name = line["Name"]
             messagebox.showinfo("Removed", f"{item_name} removed from the cart.")
-            refresh_cart_summary()
+            close_edit_row()
+            sync_row(item_id)
             remove_socket(conn)
 
         def calculate_total():
             """Calculate the total price of the items in the cart."""
-            return sum(item["Price"] * item["Quantity"] for item in cart.values())
+            return engine.cart_total()
 
-        def refresh_cart_summary():
-            """Refresh the cart summary with editable quantity and save mechanism."""
-            for widget in cart_summary_frame.winfo_children():
-                widget.destroy()
+        rows = {}  # item ID -> (row frame, quantity label), one per cart line
+        edit_row = None  # The quantity edit row, if one is open
 
-            if cart:
-                for item_id, item in cart.items():
-                    item_frame = tk.Frame(cart_summary_frame, bg="#ffffff", relief="groove", bd=2)
-                    item_frame.pack(pady=5, padx=10, fill=tk.X)
+        def add_row(item):
+            """Create the row for one cart line."""
+            item_frame = tk.Frame(cart_summary_frame, bg="#ffffff", relief="groove", bd=2)
+            item_frame.pack(pady=5, padx=10, fill=tk.X)
 
-                    # Item details
-                    tk.Label(
-                        item_frame,
-                        text=f"ID: {item['ID']}, Name: {item['Name']}, Price: £{item['Price']:.2f}",
-                        font=("Arial", 12),
-                        bg="#ffffff"
-                    ).pack(side="left", padx=10)
+            # Item details
+            tk.Label(
+                item_frame,
+                text=f"ID: {item['ID']}, Name: {item['Name']}, Price: £{item['Price']:.2f}",
+                font=("Arial", 12),
+                bg="#ffffff"
+            ).pack(side="left", padx=10)
 
-                    # Quantity field
-                    tk.Label(item_frame, text="Quantity:", bg="#ffffff", font=("Arial", 12)).pack(side="left", padx=5)
-                    quantity_label = tk.Label(item_frame, text=str(item["Quantity"]), bg="#ffffff", font=("Arial", 12))
-                    quantity_label.pack(side="left", padx=5)
+            # Quantity field
+            tk.Label(item_frame, text="Quantity:", bg="#ffffff", font=("Arial", 12)).pack(side="left", padx=5)
+            quantity_label = tk.Label(item_frame, text=str(item["Quantity"]), bg="#ffffff", font=("Arial", 12))
+            quantity_label.pack(side="left", padx=5)
 
-                    # Edit Quantity Button
-                    tk.Button(
-                        item_frame,
-                        text="Edit Quantity",
-                        command=lambda item_id=item['ID']:
-                        enable_edit_global(item_id),
-                        bg="#FFA500",
-                        fg="white",
-                        font=("Arial", 10)
-                    ).pack(side="left", padx=5)
+            # Edit Quantity Button
+            tk.Button(
+                item_frame,
+                text="Edit Quantity",
+                command=lambda item_id=item['ID']:
+                enable_edit_global(item_id),
+                bg="#FFA500",
+                fg="white",
+                font=("Arial", 10)
+            ).pack(side="left", padx=5)
 
-                    # Remove button
-                    tk.Button(
-                        item_frame,
-                        text="Remove",
-                        command=lambda item_id=item['ID']: remove_item(item_id),
-                        bg="#FF4C4C",
-                        fg="white",
-                        font=("Arial", 10)
-                    ).pack(side="right", padx=5)
+            # Remove button
+            tk.Button(
+                item_frame,
+                text="Remove",
+                command=lambda item_id=item['ID']: remove_item(item_id),
+                bg="#FF4C4C",
+                fg="white",
+                font=("Arial", 10)
+            ).pack(side="right", padx=5)
+
+            rows[item["ID"]] = (item_frame, quantity_label)
+
+        def sync_row(item_id):
+            """Bring the row for one item in line with the cart, creating, updating or removing it."""
+            item = cart.get(item_id)
+            row = rows.get(item_id)
+            if item is None:
+                if row is not None:
+                    row[0].destroy()
+                    del rows[item_id]
+            elif row is None:
+                add_row(item)
+            elif row[1].cget("text") != str(item["Quantity"]):
+                row[1].config(text=str(item["Quantity"]))
+
+            # Show the empty message only when there are no rows
+            if rows:
+                empty_label.pack_forget()
             else:
-                tk.Label(
-                    cart_summary_frame,
-                    text="Your cart is empty!",
-                    font=("Arial", 14),
-                    bg="#f0f0f0"
-                ).pack(pady=20)
+                empty_label.pack(pady=20)
 
             # Update the cart total display
             cart_total_var.set(f"Total: £{calculate_total():.2f}")
 
+        def refresh_cart_summary():
+            """Refresh the cart summary, touching only the rows whose line changed."""
+            lines = engine.cart_lines()  # The sweeper may empty the cart from another thread
+            for item_id in list(rows):
+                if item_id not in lines:
+                    sync_row(item_id)
+            for item_id in lines:
+                sync_row(item_id)
+            if not lines:
+                sync_row(None)
+
+        def close_edit_row():
+            nonlocal edit_row
+            if edit_row is not None:
+                edit_row.destroy()
+                edit_row = None
+
         def enable_edit_global(item_id):
             """Enable a global edit row for updating the quantity of an item."""
+            nonlocal edit_row
             # Clear any existing edit row
-            for widget in cart_summary_frame.winfo_children():
-                if getattr(widget, "is_edit_row", False):  # Custom attribute to mark the edit row
-                    widget.destroy()
+            close_edit_row()
+
+            line = cart.get(item_id)
+            if line is None:
+                messagebox.showinfo("Cart", "Your cart expired and its items went back on sale.")
+                refresh_cart_summary()
+                return
 
             # Create a new edit row
-            edit_row_frame = tk.Frame(cart_summary_frame, bg="#ffffff", relief="groove", bd=2)
-            edit_row_frame.is_edit_row = True  # Mark this frame as the edit row
+            edit_row_frame = edit_row = tk.Frame(cart_summary_frame, bg="#ffffff", relief="groove", bd=2)
             edit_row_frame.pack(pady=5, padx=10, fill=tk.X)
 
             # Display the item details being edited
             tk.Label(
                 edit_row_frame,
-                text=f"Editing Item: {cart[item_id]['Name']} (Current Quantity: {cart[item_id]['Quantity']})",
+                text=f"Editing Item: {line['Name']} (Current Quantity: {line['Quantity']})",
                 font=("Arial", 12),
                 bg="#ffffff"
             ).pack(side="left", padx=10)
 
             # Entry for the new quantity
             quantity_entry = tk.Entry(edit_row_frame, width=5)
-            quantity_entry.insert(0, cart[item_id]["Quantity"])  # Pre-fill with current quantity
+            quantity_entry.insert(0, line["Quantity"])  # Pre-fill with current quantity
             quantity_entry.pack(side="left", padx=5)
 
             # Save button to update the quantity
@@ -966,7 +2212,7 @@ class Cart:
             tk.Button(
                 edit_row_frame,
                 text="Cancel",
-                command=lambda: edit_row_frame.destroy(),
+                command=close_edit_row,
                 bg="#FF4C4C",
                 fg="white",
                 font=("Arial", 10)
@@ -980,36 +2226,44 @@ class Cart:
 
         def update_quantity(item_id, quantity_entry, edit_row_frame):
             """Update the inventory and cart when Save button is pressed."""
+            line = cart.get(item_id)
+
+            def cart_expired():
+                messagebox.showinfo("Cart", "Your cart expired and its items went back on sale.")
+                close_edit_row()
+                refresh_cart_summary()
+
+            if line is None:
+                cart_expired()
+                return
             try:
                 new_quantity = int(quantity_entry.get())
                 if new_quantity < 0:
                     messagebox.showerror("Invalid Input", "Quantity cannot be less than 0.")
                     quantity_entry.delete(0, tk.END)
-                    quantity_entry.insert(0, cart[item_id]["Quantity"])
+                    quantity_entry.insert(0, line["Quantity"])
                     return
 
-                original_quantity = cart[item_id]["Quantity"]
-                item_name = cart[item_id]["Name"]
+                original_quantity = line["Quantity"]
+                item_name = line["Name"]
+
+                updated = engine.set_quantity(item_id, new_quantity)
+                if updated is None:  # Expired after the check above
+                    cart_expired()
+                    return
+                if not updated:
+                    messagebox.showerror("Insufficient Stock", f"Not enough stock for {item_name}.")
+                    quantity_entry.delete(0, tk.END)
+                    quantity_entry.insert(0, original_quantity)
+                    return
 
                 if new_quantity < original_quantity:
-                    inventory[item_id]["Quantity"] += (original_quantity - new_quantity)
-                    cart[item_id]["Quantity"] = new_quantity
                     messagebox.showinfo("Updated", f"{item_name} quantity reduced in the cart.")
                 elif new_quantity > original_quantity:
-                    additional_needed = new_quantity - original_quantity
-                    if inventory[item_id]["Quantity"] >= additional_needed:
-                        inventory[item_id]["Quantity"] -= additional_needed
-                        cart[item_id]["Quantity"] = new_quantity
-                        messagebox.showinfo("Updated", f"{item_name} quantity increased in the cart.")
-                    else:
-                        messagebox.showerror("Insufficient Stock", f"Not enough stock for {item_name}.")
-                        quantity_entry.delete(0, tk.END)
-                        quantity_entry.insert(0, original_quantity)
-                        return
-
-                update_inventory_file()
-                edit_row_frame.destroy()
-                refresh_cart_summary()
+                    messagebox.showinfo("Updated", f"{item_name} quantity increased in the cart.")
+
+                close_edit_row()
+                sync_row(item_id)
             except ValueError:
                 messagebox.showerror("Invalid Input", "Please enter a valid number for the quantity.")
 
@@ -1032,6 +2286,13 @@ class Cart:
         cart_summary_frame = tk.Frame(scrollable_frame, bg="#f0f0f0")
         cart_summary_frame.pack()
 
+        empty_label = tk.Label(
+            cart_summary_frame,
+            text="Your cart is empty!",
+            font=("Arial", 14),
+            bg="#f0f0f0"
+        )
+
         # Display the initial cart summary
         refresh_cart_summary()
 
@@ -1089,10 +2350,16 @@ class Cart:
 
 # Update inventory file function
 def update_inventory_file():
-    """Write the updated inventory back to the inventory.txt file."""
-    with open("inventory.txt", "w") as file:
+    """Write the whole inventory back to the database or the inventory.txt file."""
+    if STORAGE_BACKEND == "sqlite" and store is not None:
+        store.save_products(inventory.values())
+        return
+    if INVENTORY_JOURNAL:
+        inventory_journal.rewrite(inventory.values())  # Also empties the journal
+        return
+    with open(INVENTORY_FILE, "w") as file:
         for item in inventory.values():
-            file.write(f"ID: {item['ID']}, Name: {item['Name']}, Price: {item['Price']:.2f}, Quantity: {item['Quantity']}\n")
+            file.write(format_inventory_line(item))
 
 class Order:
 
@@ -1148,52 +2415,26 @@ class Order:
                 messagebox.showwarning("Incorrect Format", "Incorrect format, expiry date must be 'MM/YY'.")
                 return
 
-            # Generate a unique transaction ID
-            transaction_id = str(uuid.uuid4())
-
-            # Calculate total cost
-            total_cost = sum(item['Price'] * item['Quantity'] for item in cart.values())
-
-            # Save transaction details to a file
-            with open(TRANSACTION_FILE, "a") as file:
-                file.write(f"\n\nTransaction ID: {transaction_id}\n")
-                file.write(f"Payment Type: {card_type}\n")
-                file.write(f"Card Number: {card_number}\n")
-                file.write(f"Expiry Date: {expiry_date}\n")
-                file.write(f"CVV: {cvv}\n")
-                file.write(f"Cart Total: £{total_cost:.2f}\n")
-                file.write("Cart Items:\n")
-                for item in cart.values():
-                    file.write(f"  - ID: {item['ID']}, Name: {item['Name']}, Quantity: {item['Quantity']}, "
-                               f"Total: £{item['Price'] * item['Quantity']:.2f}\n")
-                file.write("\n")  # Separate each transaction for readability
-                oc_socket(conn)
-
-            # Update inventory
-            with open(INVENTORY_FILE, "r") as file:
-                inventory_data = [line.strip() for line in file.readlines()]
-
-            updated_inventory = []
-            for line in inventory_data:
-                parts = line.split(", ")
-                item_id = parts[0].split(": ")[1]
-                name = parts[1].split(": ")[1]
-                price = float(parts[2].split(": ")[1])
-                quantity = int(parts[3].split(": ")[1])  # Extract numeric value from "Quantity:"
-
-                # Adjust inventory based on cart items
-                if item_id in cart:
-                    ordered_quantity = cart[item_id]['Quantity']
-                    quantity -= ordered_quantity
-                    quantity = max(quantity, 0)  # Ensure inventory does not go negative
-
-                updated_inventory.append(f"ID: {item_id}, Name: {name}, Price: {price:.2f}, Quantity: {quantity}")
-
-            with open(INVENTORY_FILE, "w") as file:
-                file.write("\n".join(updated_inventory))
-
-            # Clear the cart
-            cart.clear()
+            # Empty the cart and calculate total cost; stock was taken when items were added
+            cart_items, total_cost = engine.checkout()
+            if not cart_items:
+                messagebox.showinfo("Cart", "Your cart expired and its items went back on sale.")
+                payment_frame.pack_forget()
+                open_welcome_page(conn)
+                return
+
+            # Record the order; this returns once its batch is on disk. The CVV and expiry
+            # date are never stored, and only the last four digits of the card
+            payment = {"type": card_type, "card": mask_card(card_number)}
+            try:
+                transaction_id = checkout_pipeline.submit(cart_items, total_cost, payment).result()
+            except (OSError, sqlite3.Error) as e:
+                engine.restore_cart(cart_items)  # Nothing was sold, so the items stay in the cart
+                messagebox.showerror("Payment", f"Your order could not be saved ({e}). You have not been charged "
+                                                "and your items are still in your cart.")
+                return
+            oc_socket(conn)
+
             messagebox.showinfo("Payment", f"Payment completed successfully! Transaction ID: {transaction_id}")
 
             # Redirect to the home page
@@ -1230,8 +2471,9 @@ class Order:
         # Cart Summary Section
         tk.Label(container, text="Cart Summary", font=("Arial", 14, "bold"), bg="#f5f5f5", fg="#555").pack(pady=10)
 
-        if cart:
-            for item in cart.values():
+        lines = list(engine.cart_lines().values())  # The sweeper may empty the cart from another thread
+        if lines:
+            for item in lines:
                 tk.Label(
                     container,
                     text=f"ID: {item['ID']}, Name: {item['Name']}, Quantity: {item['Quantity']}, "
@@ -1240,7 +2482,7 @@ class Order:
                     fg="#333",
                     font=("Arial", 12)
                 ).pack(pady=5)
-            total_cost = sum(item['Price'] * item['Quantity'] for item in cart.values())
+            total_cost = sum(item['Price'] * item['Quantity'] for item in lines)
             tk.Label(container, text=f"Cart Total: £{total_cost:.2f}", font=("Arial", 12, "bold"), bg="#f5f5f5",
                      fg="#333").pack(pady=10)
         else:
@@ -1288,7 +2530,7 @@ def get_product_list():
     product_list = "\n".join(
         [
             f"ID: {item['ID']}, Name: {item['Name']}, Price: £{item['Price']:.2f}, Stock: {item['Quantity']}"
-            for item in inventory.values()
+            for item in list(inventory.values())  # Admin pages may add or remove items meanwhile
         ]
     )
     return product_list if product_list else "No products available."
@@ -1297,91 +2539,343 @@ def get_product_list():
 def read_data_from_file(filename):
     data = []
     try:
-        with open(filename, 'r') as file:
-            for line in file:
-                # Parse each line into a dictionary (ID, Name, Price, Quantity)
-                parts = line.strip().split(", ")
-                product = {}
-                for part in parts:
-                    key, value = part.split(": ")
-                    product[key.strip()] = value.strip()
-                data.append(product)
+        # Parse each line into a dictionary (ID, Name, Price, Quantity)
+        data = load_inventory_file(filename)
     except FileNotFoundError:
         print(f"Error: {filename} not found.")
     return data
 
 
 # Step 2: Create and set up the database
-def create_vending_machine_db():
-    db_conn = sqlite3.connect('vending_machine.db')  # Create or connect to a database
-    cursor = db_conn.cursor()
-
-    # Create a table for the vending machine products
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS products (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        price REAL NOT NULL,
-        quantity INTEGER NOT NULL
-    )
-    ''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS transactions (
-        name TEXT PRIMARY KEY,
-        transaction_id INTEGER NOT NULL,
-        product_id INTEGER NOT NULL,
-        price REAL NOT NULL,
-        quantity INTEGER NOT NULL
-    )
-    ''')
+class VendingStore:
+    """SQLite storage for products and transactions.
+
+    The database runs in WAL mode so readers do not block the writer, every
+    statement is a fixed SQL string so sqlite3 reuses its prepared form, and
+    each checkout is written in a single transaction along with its sales
+    rollups (see ANALYTICS.py).
+    """
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, filename=DATABASE_FILE):
+        self.conn = sqlite3.connect(filename, check_same_thread=False, cached_statements=256)
+        self.lock = threading.Lock()  # The GUI and server threads share one connection
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, fsyncs at checkpoints
+        self.legacy = self.conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION
+        self._create_schema()
+
+    def _create_schema(self):
+        with self.lock, self.conn:
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                price REAL NOT NULL,
+                quantity INTEGER NOT NULL
+            )
+            ''')
+
+            # Older databases keyed transactions on the product name, so a product could only be sold once
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(transactions)")]
+            if columns and "id" not in columns:
+                self.conn.execute("ALTER TABLE transactions RENAME TO transactions_legacy")
+
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                transaction_id TEXT NOT NULL,
+                product_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                price REAL NOT NULL,
+                quantity INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )
+            ''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_transaction_id ON transactions (transaction_id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_product_id ON transactions (product_id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions (created_at)")
+
+            if columns and "id" not in columns:
+                self.conn.execute('''
+                INSERT INTO transactions (transaction_id, product_id, name, price, quantity, created_at)
+                SELECT transaction_id, product_id, name, price, quantity, 0 FROM transactions_legacy
+                ''')
+                self.conn.execute("DROP TABLE transactions_legacy")
+
+            # One row per order; the primary key is the index that keeps transaction IDs unique
+            has_orders = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'orders'").fetchone()
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS orders (
+                transaction_id TEXT PRIMARY KEY,
+                total REAL NOT NULL,
+                created_at REAL NOT NULL
+            ) WITHOUT ROWID
+            ''')
+            if not has_orders:
+                self.conn.execute('''
+                INSERT OR IGNORE INTO orders (transaction_id, total, created_at)
+                SELECT transaction_id, SUM(price * quantity), MIN(created_at) FROM transactions GROUP BY transaction_id
+                ''')
+
+            # Per-product, per-day and per-hour sales totals, kept up to date by every checkout
+            if analytics.create_rollups(self.conn):
+                analytics.rebuild_rollups(self.conn)
+
+    def mark_current(self):
+        """Record that the database is up to date and authoritative."""
+        with self.lock, self.conn:
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.legacy = False
+
+    def load_products(self):
+        """Return every product as an item dictionary."""
+        with self.lock:
+            rows = self.conn.execute("SELECT id, name, price, quantity FROM products ORDER BY id").fetchall()
+        return [{"ID": row[0], "Name": row[1], "Price": row[2], "Quantity": row[3]} for row in rows]
+
+    def save_products(self, items):
+        """Replace the whole product table."""
+        rows = [(item["ID"], item["Name"], float(item["Price"]), int(item["Quantity"])) for item in items]
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM products")
+            self.conn.executemany("INSERT INTO products (id, name, price, quantity) VALUES (?, ?, ?, ?)", rows)
+
+    def upsert_products(self, items):
+        """Add or update products by ID in one transaction."""
+        rows = [(item["ID"], item["Name"], float(item["Price"]), int(item["Quantity"])) for item in items]
+        with self.lock, self.conn:
+            self.conn.executemany('''
+            INSERT INTO products (id, name, price, quantity) VALUES (?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET name = excluded.name, price = excluded.price, quantity = excluded.quantity
+            ''', rows)
+
+    def iter_products(self, page_size=1000):
+        """Yield every product a page at a time, so the lock is only held for one page."""
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute("SELECT id, name, price, quantity FROM products WHERE id > ? ORDER BY id LIMIT ?",
+                                         (last_id, page_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield {"ID": row[0], "Name": row[1], "Price": row[2], "Quantity": row[3]}
+            last_id = rows[-1][0]
+
+    def save_stock(self, items):
+        """Save the stock level of the changed items."""
+        with self.lock, self.conn:
+            # Read under the lock, so whichever save runs last writes the current levels
+            rows = [(item["Quantity"], item["ID"]) for item in items]
+            self.conn.executemany("UPDATE products SET quantity = ? WHERE id = ?", rows)
+
+    def record_checkout(self, transaction_id, lines, total=None):
+        """Write an order and all its lines in one transaction and return its transaction ID.
+
+        If transaction_id is None a new UUID is generated, retrying on the rare
+        collision. A given transaction_id that is already used raises sqlite3.IntegrityError.
+        """
+        if total is None:
+            total = sum(line["Price"] * line["Quantity"] for line in lines)
+        created_at = time.time()
+        with self.lock:
+            while True:
+                order_id = transaction_id or str(uuid.uuid4())
+                try:
+                    with self.conn:
+                        # The primary key lookup rejects a duplicate ID without scanning past orders
+                        self.conn.execute("INSERT INTO orders (transaction_id, total, created_at) VALUES (?, ?, ?)",
+                                          (order_id, total, created_at))
+                        self.conn.executemany('''
+                        INSERT INTO transactions (transaction_id, product_id, name, price, quantity, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ''', [(order_id, line["ID"], line["Name"], line["Price"], line["Quantity"], created_at)
+                              for line in lines])
+                        analytics.update_rollups(self.conn, [(created_at, lines)])
+                    return order_id
+                except sqlite3.IntegrityError:
+                    if transaction_id is not None:
+                        raise
+
+    def record_checkouts(self, orders):
+        """Write a batch of (lines, total) orders in one durable transaction and return their IDs."""
+        created_at = time.time()
+        ids = [str(uuid.uuid4()) for _ in orders]
+        with self.lock:
+            # A full sync for the batch's commit, so acknowledged orders survive a power cut
+            self.conn.execute("PRAGMA synchronous=FULL")
+            try:
+                with self.conn:
+                    self.conn.executemany("INSERT INTO orders (transaction_id, total, created_at) VALUES (?, ?, ?)",
+                                          [(order_id, total, created_at) for order_id, (_, total) in zip(ids, orders)])
+                    self.conn.executemany('''
+                    INSERT INTO transactions (transaction_id, product_id, name, price, quantity, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ''', [(order_id, line["ID"], line["Name"], line["Price"], line["Quantity"], created_at)
+                          for order_id, (lines, _) in zip(ids, orders) for line in lines])
+                    analytics.update_rollups(self.conn, [(created_at, lines) for lines, _ in orders])
+            except sqlite3.IntegrityError:
+                ids = None  # A UUID collided, fall back to one order at a time
+            finally:
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+        if ids is None:
+            ids = [self.record_checkout(None, lines, total) for lines, total in orders]
+        return ids
+
+    def rebuild_rollups(self):
+        """Recompute the sales rollups from scratch."""
+        with self.lock:
+            analytics.rebuild_rollups(self.conn)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class CheckoutPipeline:
+    """Commit completed orders in groups instead of one write per order.
+
+    submit() queues an order and returns a Future. A worker thread takes
+    everything queued (up to max_batch, waiting up to max_wait for more to
+    arrive), writes the whole batch in one database transaction and appends
+    its records to the transaction log with one write and one fsync. The
+    batch's Futures are resolved with their transaction IDs once the
+    database commit succeeds, so an acknowledged order is always on disk.
+    The database is the record of sales, so a failed log write is reported
+    and counted but does not fail orders that were already committed.
+    """
+
+    def __init__(self, store, log=None, max_batch=CHECKOUT_BATCH, max_wait=CHECKOUT_WAIT):
+        self.store = store
+        self.log = log or transaction_log
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.orders = queue.Queue()
+        self.worker = None
+        self.batches = 0  # Batches committed, for the benchmark
+        self.committed = 0  # Orders committed
+        self.log_failures = 0  # Batches committed to the database but missing from the log
+
+    def start(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._run, daemon=True)
+            self.worker.start()
+        return self
+
+    def submit(self, lines, total, payment=None):
+        """Queue an order. payment is stored in the log as given, so mask card numbers first."""
+        future = Future()
+        self.orders.put((lines, total, payment, future))
+        return future
+
+    def stop(self):
+        """Commit everything still queued and stop the worker."""
+        if self.worker is not None:
+            self.orders.put(None)
+            self.worker.join()
+            self.worker = None
+
+    def _next_batch(self):
+        first = self.orders.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                order = self.orders.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if order is None:
+                self.orders.put(None)  # Stop after this batch
+                break
+            batch.append(order)
+        return batch
 
-    db_conn.commit()  # Commit changes
-    return db_conn, cursor
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                ids = self.store.record_checkouts([(lines, total) for lines, total, _, _ in batch])
+            except Exception as error:
+                for *_, future in batch:
+                    future.set_exception(error)
+                continue
+            try:
+                created_at = time.time()
+                self.log.append([(order_id, created_at, encode_record(order_id, created_at, total, lines, payment))
+                                 for order_id, (lines, total, payment, _) in zip(ids, batch)])
+            except Exception as error:
+                self.log_failures += 1
+                print(f"Error writing {len(batch)} orders to the transaction log: {error}")
+            self.batches += 1
+            self.committed += len(batch)
+            for order_id, (*_, future) in zip(ids, batch):
+                future.set_result(order_id)
+
+
+store = None  # Set up by mainsqlsetup()
+checkout_pipeline = None  # Set up by start_vending_machine()
+
+
+def create_vending_machine_db():
+    global store
+    store = VendingStore()  # Create or connect to the database and bring the schema up to date
+    return store.conn, store.conn.cursor()
 
 # Step 3: Insert data into the database
 def insert_data_into_db(data, cursor):
-    for product in data:
-        # Insert data into the 'products' table
-        cursor.execute('''
-        INSERT OR IGNORE INTO products (id, name, price, quantity) VALUES (?, ?, ?, ?)
-        ''', (product['ID'], product['Name'], float(product['Price']), int(product['Quantity'])))
-
-    cursor.connection.commit()  # Commit changes to the database
+    """Seed the products table. Only used while the text file is still the source of truth."""
+    store.save_products(
+        {"ID": int(product['ID']), "Name": product['Name'], "Price": product['Price'], "Quantity": product['Quantity']}
+        for product in data
+    )
 
 def insert_transaction_into_db(data, cursor):
-    for cart in data:
-        # Insert data into the 'products' table
-        cursor.execute('''
-        INSERT INTO transactions (product_id, product_name, price, quantity) VALUES (?, ?, ?, ?)
-        ''', (cart['ID'], cart['Name'], float(cart['Price']), int(cart['Quantity'])))
-
-    cursor.connection.commit()  # Commit changes to the database
+    return store.record_checkout(None, data)
 
 
 # Main function to integrate all steps
 def mainsqlsetup():
-    filename = 'inventory.txt'
-    data = read_data_from_file(filename)
+    db_conn, cursor = create_vending_machine_db()
 
-    if data:
-        db_conn, cursor = create_vending_machine_db()
-        insert_data_into_db(data, cursor)
-    else:
-        db_conn, cursor = create_vending_machine_db()
+    # The first time the database is opened by this version, the text file still holds the real stock
+    if store.legacy:
+        filename = 'inventory.txt'
+        data = inventory_journal.replay() if INVENTORY_JOURNAL else read_data_from_file(filename)
+        if data:
+            insert_data_into_db(data, cursor)
+        store.mark_current()
 
     return db_conn, cursor
 
 def start_vending_machine(root):
     """Set up and run the vending machine GUI."""
+    global checkout_pipeline
     sql_conn, cursor = mainsqlsetup()
+    checkout_pipeline = CheckoutPipeline(store).start()
+    assets.preload([WELCOME_IMAGE])  # Decode images before the first page needs them
     product = Product()
     product.load_inventory()
+    # Save stock changes made through the engine
+    if STORAGE_BACKEND == "sqlite":
+        engine.listeners.append(store.save_stock)
+    elif INVENTORY_JOURNAL:
+        engine.listeners.append(inventory_journal.append)
+    else:
+        engine.listeners.append(lambda items: update_inventory_file())
+    engine.start_sweeper()  # Abandoned carts give their stock back after CART_HOLD_TTL
 
     open_welcome_page(sql_conn)
     root.mainloop()  # Use the existing root instance
 
-    sql_conn.close()
+    checkout_pipeline.stop()  # Commit any orders still queued
+    store.close()
 
 if __name__ == "__main__":
     # Initialize the root window
@@ -1390,7 +2884,12 @@ if __name__ == "__main__":
     root.geometry("500x400")
 
     # Start the server in a separate thread
-    server_thread = threading.Thread(target=start_server)
+    if SERVER_MODE == "asyncio":
+        async_server = AsyncVendingServer()
+        engine.watchers.append(async_server.publish_stock)  # Live stock updates for subscribed clients
+        server_thread = threading.Thread(target=async_server.run)
+    else:
+        server_thread = threading.Thread(target=start_server)
     server_thread.daemon = True  # This ensures the thread exits when the main program exits
     server_thread.start()
 
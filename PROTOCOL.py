@@ -0,0 +1,62 @@
+import struct
+
+# Every message on the wire is a frame: a 4-byte body length, a 4-byte message ID,
+# then the UTF-8 body. Message ID 0 is used for the handshake and for commands the
+# server pushes on its own; client requests use IDs from 1 up and the server's reply
+# carries the same ID, so several requests can be in flight on one connection.
+HEADER = struct.Struct("!II")
+PUSH_ID = 0
+MAX_FRAME = 1024 * 1024  # Largest body accepted, to stop a bad length from eating memory
+
+
+def encode_frame(message_id, text):
+    """Encode one message as a frame."""
+    body = text.encode('utf-8')
+    return HEADER.pack(len(body), message_id) + body
+
+
+def encode_frames(messages):
+    """Encode (message ID, text) pairs into one buffer so they go out in a single write."""
+    return b"".join(encode_frame(message_id, text) for message_id, text in messages)
+
+
+class FrameDecoder:
+    """Turn a stream of received bytes back into whole messages.
+
+    TCP may split a frame across reads or put several frames in one read,
+    so bytes are buffered until each frame is complete.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes and return the list of completed (message ID, text) pairs."""
+        self.buffer += data
+        messages = []
+        offset = 0
+        view = memoryview(self.buffer)
+        while len(self.buffer) - offset >= HEADER.size:
+            length, message_id = HEADER.unpack_from(self.buffer, offset)
+            if length > MAX_FRAME:
+                view.release()
+                raise ValueError(f"Frame of {length} bytes is larger than {MAX_FRAME}")
+            end = offset + HEADER.size + length
+            if end > len(self.buffer):
+                break
+            messages.append((message_id, str(view[offset + HEADER.size:end], 'utf-8')))
+            offset = end
+        view.release()
+        del self.buffer[:offset]  # Drop everything decoded in one go
+        return messages
+
+
+def recv_messages(sock, decoder, bufsize):
+    """Block until at least one whole message arrives. Returns None if the connection closed."""
+    while True:
+        data = sock.recv(bufsize)
+        if not data:
+            return None
+        messages = decoder.feed(data)
+        if messages:
+            return messages
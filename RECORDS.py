@@ -0,0 +1,101 @@
+import gzip
+import json
+import mmap
+import struct
+import zlib
+
+# Every transaction log record is a fixed header followed by a JSON body:
+# magic, format version, body length, time of the order (seconds since the epoch)
+# and a CRC32 of the body. The length lets a reader hop from header to header,
+# and the CRC lets it stop at a record that was only half written when the
+# machine went down.
+HEADER = struct.Struct("!4sBxIdI")
+MAGIC = b"VMTX"
+VERSION = 1
+
+
+def mask_card(number):
+    """Keep only the last four digits of a card number."""
+    number = str(number)
+    return "*" * max(len(number) - 4, 0) + number[-4:]
+
+
+def encode_record(transaction_id, created_at, total, lines, payment=None):
+    """Encode one order as a record. payment should already be masked; it is stored as given."""
+    body = json.dumps({
+        "id": transaction_id,
+        "total": total,
+        "lines": [{"ID": line["ID"], "Name": line["Name"], "Price": line["Price"], "Quantity": line["Quantity"]}
+                  for line in lines],
+        "payment": payment,
+    }, separators=(",", ":")).encode("utf-8")
+    return HEADER.pack(MAGIC, VERSION, len(body), created_at, zlib.crc32(body)) + body
+
+
+def iter_records(buffer, start=None, end=None):
+    """Yield (time, body) for each whole record in buffer, where body is a memoryview into it.
+
+    Nothing is copied, so each body is only valid until the next one is
+    yielded. Stops at the first record that is cut short or fails its CRC.
+    """
+    view = memoryview(buffer)
+    try:
+        offset = 0
+        while offset + HEADER.size <= len(view):
+            magic, version, length, created_at, crc = HEADER.unpack_from(view, offset)
+            body_start = offset + HEADER.size
+            body_end = body_start + length
+            if magic != MAGIC or body_end > len(view):
+                return  # Torn write at the end of the file
+            body = view[body_start:body_end]
+            try:
+                if zlib.crc32(body) != crc:
+                    return
+                if (start is None or created_at >= start) and (end is None or created_at <= end):
+                    yield created_at, body
+            finally:
+                body.release()
+            offset = body_end
+    finally:
+        view.release()
+
+
+class RecordReader:
+    """Read a record file through a memory map, or a gzipped one from memory."""
+
+    def __init__(self, path):
+        self.map = None
+        if path.endswith(".gz"):
+            with gzip.open(path, "rb") as file:
+                self.buffer = file.read()
+        else:
+            with open(path, "rb") as file:
+                if file.seek(0, 2) == 0:
+                    self.buffer = b""  # mmap cannot map an empty file
+                else:
+                    self.map = self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def __iter__(self):
+        return self.records()
+
+    def scan(self, start=None, end=None):
+        """Yield (time, body) without decoding anything; see iter_records."""
+        return iter_records(self.buffer, start, end)
+
+    def records(self, start=None, end=None):
+        """Yield each record as a dict, with its time under "created_at"."""
+        for created_at, body in iter_records(self.buffer, start, end):
+            record = json.loads(bytes(body))
+            record["created_at"] = created_at
+            yield record